@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the hot request paths.
+
+Runs entirely offline against a throwaway SQLite database, driving
+``src.main.app`` through the Flask test client.
+
+Usage:
+    python benchmarks/bench.py run --products 2000 --orders 1000 --output results.json
+    python benchmarks/bench.py budgets
+    python benchmarks/bench.py compare results.json --baseline benchmarks/baseline.json --threshold 0.25
+
+Before timing anything, ``run`` replays each request case once under
+``query_budget`` (``QUERY_BUDGETS``) and exits with status 1 if a case runs
+more SQL statements than its budget or shows a probable N+1; ``budgets``
+does only that check.
+
+``compare`` exits with status 1 when any case's p50 or p99 is slower than
+the baseline by more than ``threshold`` (a fraction, 0.25 = 25%). Timings
+from a different dataset size or backend aren't comparable, so it refuses
+(status 2) when those ``meta`` fields differ from the baseline, unless
+``--allow-mismatch`` is given.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CATEGORIES = ['Electronics', 'Accessories', 'Sports & Fitness', 'Home & Garden', 'Kitchen', 'Clothing']
+WORDS = ['wireless', 'premium', 'compact', 'durable', 'smart', 'classic', 'portable', 'organic',
+         'steel', 'leather', 'cotton', 'ergonomic', 'waterproof', 'vintage', 'modern', 'lightweight']
+NOUNS = ['headphones', 'backpack', 'lamp', 'bottle', 'mat', 'watch', 'jacket', 'kettle',
+         'speaker', 'chair', 'shoes', 'camera', 'blender', 'wallet', 'keyboard', 'tent']
+
+# Meta fields that must match for two runs' timings to be comparable
+COMPARABLE_META = ('products', 'orders', 'items_per_order', 'page_size', 'cart_items', 'seed',
+                   'database', 'cart_store')
+
+# Most statements a warm request may run; none depends on page size or data
+# volume, so an N+1 regression in a listing or the admin order list fails here
+QUERY_BUDGETS = {
+    'products.list': 3,
+    'products.list_deep_page': 3,
+    'products.list_cached': 1,
+    'products.search': 3,
+    'products.sort_price': 3,
+    'products.category': 3,
+    'products.detail': 2,
+    'cart.get': 2,
+    'cart.count': 1,
+    'admin.orders': 7,
+    'admin.order_stats': 6,
+    'admin.product_analytics': 5,
+}
+
+CHECKOUT_BODY = {
+    'customer_name': 'Bench Customer',
+    'customer_email': 'bench@example.com',
+    'shipping_address': '1 Benchmark Way'
+}
+
+def create_app(database_path):
+    """Import the app against a fresh SQLite file"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{database_path}'
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+    os.environ['QUERY_STATS_HEADERS'] = 'false'
+    from src.main import app
+    from src.manage import init_database
+    init_database(app)
+    return app
+
+def populate(app, products, orders, items_per_order, seed):
+    """Bulk-load a catalog and order history of the requested size"""
+    from sqlalchemy import insert
+    from src.models.user import db
+    from src.models.product import Product, Order, OrderItem
+    from src.models.admin import Admin
+    from src.order_stats import rebuild_order_stats
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        db.session.execute(insert(Product), [{
+            'name': f'{rng.choice(WORDS).title()} {rng.choice(NOUNS).title()} {i}',
+            'description': ' '.join(rng.choice(WORDS + NOUNS) for _ in range(30)),
+            'price': round(rng.uniform(5, 500), 2),
+            'image_url': '',
+            'category': rng.choice(CATEGORIES),
+            'stock_quantity': 1_000_000,
+            'created_at': now - timedelta(minutes=i),
+            'is_active': True
+        } for i in range(products)])
+
+        product_ids = [row[0] for row in db.session.query(Product.id).all()]
+        order_rows, item_rows = [], []
+        for i in range(orders):
+            order_rows.append({
+                'id': i + 1,
+                'order_number': f'BENCH-{i:08d}',
+                'customer_name': f'Customer {i % 500}',
+                'customer_email': f'customer{i % 500}@example.com',
+                'shipping_address': f'{i} Example Street',
+                'total_amount': 0.0,
+                'status': rng.choice(['confirmed', 'processing', 'shipped', 'delivered', 'cancelled']),
+                'created_at': now - timedelta(hours=i)
+            })
+            for _ in range(items_per_order):
+                item_rows.append({
+                    'order_id': i + 1,
+                    'product_id': rng.choice(product_ids),
+                    'quantity': rng.randint(1, 3),
+                    'price': round(rng.uniform(5, 500), 2)
+                })
+                order_rows[-1]['total_amount'] += item_rows[-1]['quantity'] * item_rows[-1]['price']
+        if order_rows:
+            db.session.execute(insert(Order), order_rows)
+            db.session.execute(insert(OrderItem), item_rows)
+            # Core inserts skip the ORM hooks that maintain the order stats rollups
+            rebuild_order_stats(db.session.connection())
+
+        # The sample products seeded at import need enough stock for checkout runs
+        db.session.query(Product).update({Product.stock_quantity: 1_000_000})
+
+        admin = Admin(username='bench', email='bench@example.com')
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.commit()
+
+def measure(func, iterations, warmup, setup=None):
+    """Time ``func`` ``iterations`` times and return latency percentiles in ms"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        'iterations': iterations,
+        'mean': statistics.fmean(samples),
+        'min': samples[0],
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': samples[-1]
+    }
+
+def build_cases(app, args):
+    """Return ``{name: (func, setup)}`` for every benchmarked path"""
+    from src.models.product import Product, Order
+    from src.cache import catalog_cache
+
+    client = app.test_client()
+    admin_client = app.test_client()
+    admin_client.post('/api/admin/login', json={'username': 'bench', 'password': 'bench'})
+
+    def get(c, url):
+        def run():
+            response = c.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return run
+
+    def uncached(func):
+        # The catalog cache would otherwise turn every iteration into a hit
+        def run():
+            catalog_cache.clear()
+            func()
+        return run
+
+    ctx = app.app_context()
+    ctx.push()
+    products = Product.query.limit(args.page_size).all()
+    orders = Order.query.options(Order.eager_items()).order_by(Order.id).limit(args.page_size).all()
+
+    cart_client = app.test_client()
+    cart_product_ids = [p.id for p in products[:args.cart_items]]
+    cart_client.get('/api/cart/count')
+    for product_id in cart_product_ids:
+        cart_client.post('/api/cart/add', json={'product_id': product_id, 'quantity': 1})
+
+    checkout_client = app.test_client()
+    def fill_checkout_cart():
+        for product_id in cart_product_ids:
+            checkout_client.post('/api/cart/add', json={'product_id': product_id, 'quantity': 1})
+
+    def checkout():
+        response = checkout_client.post('/api/orders/checkout', json=CHECKOUT_BODY)
+        assert response.status_code == 201, response.get_json()
+
+    search_term = NOUNS[0]
+    per_page = f'per_page={args.page_size}'
+    return {
+        'serialize.product_to_dict': (lambda: [p.to_dict() for p in products], None),
+        'serialize.order_to_dict': (lambda: [o.to_dict() for o in orders], None),
+        'products.list': (uncached(get(client, f'/api/products?{per_page}')), None),
+        'products.list_deep_page': (uncached(get(client, f'/api/products?{per_page}&page=20')), None),
+        'products.list_cached': (get(client, f'/api/products?{per_page}'), None),
+        'products.search': (uncached(get(client, f'/api/products?{per_page}&search={search_term}')), None),
+        'products.sort_price': (uncached(get(client, f'/api/products?{per_page}&sort_by=price&sort_order=asc')), None),
+        'products.category': (uncached(get(client, f'/api/products?{per_page}&category={CATEGORIES[0]}')), None),
+        'products.detail': (uncached(get(client, f'/api/products/{products[0].id}')), None),
+        'cart.get': (get(cart_client, '/api/cart'), None),
+        'cart.count': (get(cart_client, '/api/cart/count'), None),
+        'orders.checkout': (checkout, fill_checkout_cart),
+        'admin.orders': (get(admin_client, f'/api/admin/orders?{per_page}'), None),
+        'admin.order_stats': (get(admin_client, '/api/admin/orders/stats'), None),
+        'admin.product_analytics': (get(admin_client, '/api/admin/products/analytics'), None),
+    }
+
+def query_budgets(args):
+    """Return ``{name: (max_queries, allow_n_plus_one)}`` for the budgeted cases"""
+    budgets = {name: (limit, False) for name, limit in QUERY_BUDGETS.items()}
+    # Checkout takes stock with one conditional update per cart line, by design
+    budgets['orders.checkout'] = (12 + args.cart_items, True)
+    return budgets
+
+def check_budgets(cases, selected, args):
+    """Run each budgeted case once warm under ``query_budget``; returns the failures"""
+    from src.query_stats import QueryBudgetExceeded, query_budget
+
+    failures = []
+    for name, (max_queries, allow_n_plus_one) in query_budgets(args).items():
+        if name not in selected:
+            continue
+        func, setup = cases[name]
+        for _ in range(2):
+            if setup:
+                setup()
+            func()
+        if setup:
+            setup()
+        try:
+            with query_budget(max_queries, allow_n_plus_one=allow_n_plus_one) as recorder:
+                func()
+        except QueryBudgetExceeded as e:
+            failures.append((name, str(e)))
+            print(f'{name:32s} OVER BUDGET')
+            continue
+        print(f'{name:32s} {recorder.count:3d} of {max_queries} queries')
+    return failures
+
+def prepare(args):
+    """Build and populate a throwaway database; returns ``(app, cases, selected, load_seconds)``"""
+    database_path = os.path.join(tempfile.mkdtemp(prefix='shopelite-bench-'), 'bench.db')
+    app = create_app(database_path)
+
+    load_start = time.perf_counter()
+    populate(app, args.products, args.orders, args.items_per_order, args.seed)
+    load_seconds = time.perf_counter() - load_start
+
+    cases = build_cases(app, args)
+    selected = [name for name in cases if not args.only or any(part in name for part in args.only)]
+    return app, cases, selected, load_seconds
+
+def report_budget_failures(failures):
+    print(f'\n{len(failures)} case(s) over their query budget:')
+    for name, message in failures:
+        print(f'  {name}: {message}')
+
+def budgets(args):
+    _, cases, selected, _ = prepare(args)
+    failures = check_budgets(cases, selected, args)
+    if failures:
+        report_budget_failures(failures)
+        return 1
+    print('\nAll cases within their query budgets')
+    return 0
+
+def run(args):
+    app, cases, selected, load_seconds = prepare(args)
+
+    failures = check_budgets(cases, selected, args)
+    if failures:
+        report_budget_failures(failures)
+        return None
+
+    results = {}
+    for name in selected:
+        func, setup = cases[name]
+        results[name] = measure(func, args.iterations, args.warmup, setup)
+        print(f"{name:32s} p50 {results[name]['p50']:8.3f}ms  p99 {results[name]['p99']:8.3f}ms")
+
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'products': args.products,
+            'orders': args.orders,
+            'items_per_order': args.items_per_order,
+            'page_size': args.page_size,
+            'cart_items': args.cart_items,
+            'iterations': args.iterations,
+            'seed': args.seed,
+            'database': 'sqlite',
+            'cart_store': app.config['CART_STORE'],
+            'load_seconds': load_seconds
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f'Wrote {args.output}')
+    return report
+
+def compare(args):
+    with open(args.results) as f:
+        current = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    mismatched = [
+        (key, baseline['meta'].get(key), current['meta'].get(key))
+        for key in COMPARABLE_META if baseline['meta'].get(key) != current['meta'].get(key)
+    ]
+    if mismatched:
+        print('Results and baseline were run on different datasets or backends:')
+        for key, base, now in mismatched:
+            print(f'  {key}: baseline {base!r}, results {now!r}')
+        if not args.allow_mismatch:
+            print('Not comparing; rerun with the baseline\'s settings or pass --allow-mismatch')
+            return 2
+        print('WARNING: comparing anyway (--allow-mismatch); differences below are not regressions\n')
+
+    regressions = []
+    print(f"{'case':32s} {'p50 base':>10s} {'p50 now':>10s} {'p99 base':>10s} {'p99 now':>10s}")
+    for name, base in sorted(baseline['results'].items()):
+        now = current['results'].get(name)
+        if now is None:
+            print(f'{name:32s} missing from results')
+            continue
+        flags = []
+        for metric in ('p50', 'p99'):
+            if now[metric] > base[metric] * (1 + args.threshold):
+                flags.append(metric)
+                regressions.append((name, metric, base[metric], now[metric]))
+        print(f"{name:32s} {base['p50']:10.3f} {now['p50']:10.3f} {base['p99']:10.3f} {now['p99']:10.3f}"
+              f"{'  REGRESSED ' + ','.join(flags) if flags else ''}")
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:')
+        for name, metric, base, now in regressions:
+            print(f'  {name} {metric}: {base:.3f}ms -> {now:.3f}ms ({now / base - 1:+.0%})')
+        return 1
+
+    print(f'\nNo regressions beyond {args.threshold:.0%}')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Check query budgets, then run the benchmarks')
+    budgets_parser = commands.add_parser('budgets', help='Only check per-request query budgets')
+    for command_parser in (run_parser, budgets_parser):
+        command_parser.add_argument('--products', type=int, default=2000)
+        command_parser.add_argument('--orders', type=int, default=1000)
+        command_parser.add_argument('--items-per-order', type=int, default=3)
+        command_parser.add_argument('--page-size', type=int, default=20)
+        command_parser.add_argument('--cart-items', type=int, default=5)
+        command_parser.add_argument('--seed', type=int, default=42)
+        command_parser.add_argument('--only', nargs='*', help='Only run cases whose name contains one of these')
+    run_parser.add_argument('--iterations', type=int, default=100)
+    run_parser.add_argument('--warmup', type=int, default=5)
+    run_parser.add_argument('--output', help='Write results JSON here')
+
+    compare_parser = commands.add_parser('compare', help='Compare results against a baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--baseline', default=os.path.join(ROOT, 'benchmarks', 'baseline.json'))
+    compare_parser.add_argument('--threshold', type=float, default=0.25)
+    compare_parser.add_argument('--allow-mismatch', action='store_true',
+                                help='Compare even if dataset sizes or backends differ (warns loudly)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return 0 if run(args) is not None else 1
+    if args.command == 'budgets':
+        return budgets(args)
+    return compare(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,6 +15,10 @@ echo "Copying frontend build to Flask static folder..."
 rm -rf src/static/*
 cp -r frontend/dist/* src/static/
 
+# Write .gz/.br next to each asset so they are served without compressing per request
+echo "Precompressing static assets..."
+python src/static_files.py compress
+
 # Install Python dependencies
 echo "Installing Python dependencies..."
 pip install -r requirements.txt
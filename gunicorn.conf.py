@@ -0,0 +1,20 @@
+"""
+Gunicorn settings, picked up automatically from the working directory by
+``gunicorn src.main:app``.
+
+The app is loaded once in the master (``preload_app``) and workers are
+forked from it, so they start in milliseconds and share the loaded code
+copy-on-write. Creating and seeding the database is not part of startup;
+run ``python src/manage.py init`` once per deploy before starting.
+"""
+import gc
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+# Recycle workers after this many requests (0 = never); cheap with preload
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+def pre_fork(server, worker):
+    # Keep the collector from touching, and so un-sharing, objects the master loaded
+    gc.freeze()
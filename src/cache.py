@@ -0,0 +1,111 @@
+"""
+In-process catalog read cache.
+
+Catalog endpoints cache their JSON payloads here, keyed on normalized query
+arguments. Every route that writes products calls ``invalidate_catalog``
+after committing. The cache lives in each worker process, so the TTL bounds
+how long another worker can serve a payload that predates a write.
+
+``fragment_cache`` holds individual serialized products for
+``src/serialization.py``; its keys carry the product version instead.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` or ``default``"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``, evicting the least recently used entry if full"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_where(self, predicate):
+        """Drop every entry whose key satisfies ``predicate``"""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+catalog_cache = TTLCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', 60))
+)
+
+# Serialized products keyed on (id, version, fields); see src/serialization.py.
+# Versioned keys never go stale, so the TTL only bounds memory held by old versions.
+fragment_cache = TTLCache(
+    maxsize=int(os.environ.get('PRODUCT_FRAGMENT_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('PRODUCT_FRAGMENT_CACHE_TTL', 3600))
+)
+
+def invalidate_catalog(product_ids=None):
+    """Drop cached catalog payloads affected by a product write.
+
+    Listings, categories and admin analytics depend on every product and are
+    always dropped. Single-product entries are dropped only for
+    ``product_ids``, or all of them when the ids are unknown (None).
+
+    This only clears the calling worker's cache. Entries served under an
+    ETag must also be keyed on the version that ETag is built from, so
+    other workers miss as soon as the shared version moves.
+    """
+    if product_ids is None:
+        catalog_cache.clear()
+        return
+
+    product_ids = {int(product_id) for product_id in product_ids}
+    catalog_cache.delete_where(
+        lambda key: key[0] != 'product' or key[1] in product_ids
+    )
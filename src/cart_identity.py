@@ -0,0 +1,70 @@
+"""
+Cart identity carried in a signed cookie.
+
+A visitor's cart id lives in the ``cart_id`` cookie, signed with the app's
+``SECRET_KEY`` so it can't be forged or guessed, and is checked without any
+server-side lookup. Nothing is issued until the visitor first adds to a
+cart, so browsing, bots and ``GET /api/cart/count`` never create a
+server-side session or a ``flask_sessions`` row.
+
+Every cart write re-issues the cookie, so it expires ``CART_TTL`` seconds
+after the cart was last changed, and also leaves the cart's stored lines
+at least that fresh, so the abandoned-cart sweeper never deletes a cart
+whose cookie is still valid. Carts created before this cookie existed are
+kept in the server-side session; their id is moved into the cookie on the
+visitor's next request.
+"""
+import uuid
+from flask import current_app, g, request, session
+from itsdangerous import BadSignature, URLSafeSerializer
+from src.cart_store import get_cart_store
+
+CART_COOKIE = 'cart_id'
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='cart-id')
+
+def _legacy_cart_id():
+    # Only look when the client has a session; an empty one is never stored
+    if current_app.config.get('SESSION_COOKIE_NAME', 'session') in request.cookies:
+        return session.get('cart_session_id')
+    return None
+
+def current_cart_id():
+    """Return the visitor's cart id, or None if they have never had a cart"""
+    if 'cart_id' not in g:
+        cart_id = None
+        signed = request.cookies.get(CART_COOKIE)
+        if signed:
+            try:
+                cart_id = _serializer().loads(signed)
+            except BadSignature:
+                cart_id = None
+        if cart_id is None:
+            cart_id = _legacy_cart_id()
+            if cart_id is not None:
+                # The new cookie lasts CART_TTL from now, so the stored cart must too
+                get_cart_store().touch(cart_id)
+                g.issue_cart_cookie = True
+        g.cart_id = cart_id
+    return g.cart_id
+
+def ensure_cart_id():
+    """Return the visitor's cart id, creating one if needed; for cart writes"""
+    cart_id = current_cart_id()
+    if cart_id is None:
+        cart_id = g.cart_id = str(uuid.uuid4())
+    g.issue_cart_cookie = True
+    return cart_id
+
+def init_cart_identity(app):
+    """Set the cart cookie on responses that created or wrote to a cart"""
+    @app.after_request
+    def _issue_cart_cookie(response):
+        if g.get('issue_cart_cookie'):
+            response.set_cookie(
+                CART_COOKIE, _serializer().dumps(g.cart_id), max_age=app.config.get('CART_TTL'),
+                httponly=True, secure=app.config.get('SESSION_COOKIE_SECURE', False),
+                samesite=app.config.get('SESSION_COOKIE_SAMESITE')
+            )
+        return response
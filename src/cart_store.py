@@ -0,0 +1,451 @@
+"""
+Cart storage backends.
+
+Cart routes talk to a ``CartStore`` instead of the ``CartItem`` table
+directly. Three backends are available, chosen with the ``CART_STORE``
+setting:
+
+- ``sql`` (default): ``CartItem`` rows in the primary database.
+- ``memory``: per-process dicts with a TTL. Only suitable for a single
+  worker or sticky sessions.
+- ``redis``: one hash per cart on any Redis-protocol server
+  (``CART_REDIS_URL``). Needs the ``redis`` package.
+
+Lines are plain dicts with ``id``, ``product_id``, ``quantity``,
+``unit_price`` and ``created_at``. The memory and Redis backends use the
+product id as the line id and keep each cart's line count, quantity and
+total up to date on every write, so ``summary`` is O(1). With them the
+primary database only sees a cart when checkout turns it into an order.
+
+The price of that running total is the one passed in when each line was
+last added or changed, so after a price change their ``summary`` total
+(``GET /api/cart/count``) drifts from the live price until the line is
+next written. The SQL backend joins the live price. The cart page and
+checkout always price lines from ``Product``, whatever the backend.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import delete, func
+from src.models.user import db
+from src.models.product import Product, CartItem
+
+DEFAULT_CART_TTL = 7 * 24 * 3600
+
+class CartStore:
+    """Interface shared by all cart backends"""
+
+    def lines(self, cart_id):
+        """Return the cart's lines in insertion order"""
+        raise NotImplementedError
+
+    def get_line(self, cart_id, item_id):
+        """Return one line, or None if it isn't in this cart"""
+        raise NotImplementedError
+
+    def add(self, cart_id, product_id, quantity, unit_price):
+        """Add ``quantity`` of a product, merging with an existing line"""
+        raise NotImplementedError
+
+    def set_quantity(self, cart_id, item_id, quantity, unit_price):
+        """Replace a line's quantity; returns False if the line doesn't exist"""
+        raise NotImplementedError
+
+    def remove(self, cart_id, item_id):
+        """Remove a line; returns False if the line doesn't exist"""
+        raise NotImplementedError
+
+    def clear(self, cart_id):
+        raise NotImplementedError
+
+    def touch(self, cart_id):
+        """Restart the cart's idle timer without changing its lines"""
+        raise NotImplementedError
+
+    def summary(self, cart_id):
+        """Return ``{'count', 'quantity', 'total'}`` for the cart; see the module docstring on prices"""
+        raise NotImplementedError
+
+    def claim(self, cart_id, lines):
+        """Atomically take the cart for checkout.
+
+        Succeeds only if the cart still holds exactly ``lines``. The SQL
+        backend deletes inside the current transaction, so a rollback undoes
+        it; the other backends remove the cart immediately and need
+        ``restore`` if the order can't be committed.
+        """
+        raise NotImplementedError
+
+    def restore(self, cart_id, lines):
+        """Put back lines taken by ``claim`` after a failed checkout"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {'backend': self.name}
+
+def _line_key(lines):
+    return sorted((line['product_id'], line['quantity']) for line in lines)
+
+class SQLCartStore(CartStore):
+    """Carts as ``CartItem`` rows in the primary database"""
+    name = 'sql'
+
+    def _line(self, item, unit_price=None):
+        return {
+            'id': item.id,
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'unit_price': unit_price,
+            'created_at': item.created_at
+        }
+
+    def lines(self, cart_id):
+        items = CartItem.query.filter_by(session_id=cart_id).order_by(CartItem.id).all()
+        return [self._line(item) for item in items]
+
+    def get_line(self, cart_id, item_id):
+        item = CartItem.query.filter_by(id=item_id, session_id=cart_id).first()
+        return self._line(item) if item else None
+
+    def add(self, cart_id, product_id, quantity, unit_price):
+        item = CartItem.query.filter_by(session_id=cart_id, product_id=product_id).first()
+        if item:
+            item.quantity += quantity
+        else:
+            item = CartItem(session_id=cart_id, product_id=product_id, quantity=quantity)
+            db.session.add(item)
+        db.session.commit()
+        return self._line(item, unit_price)
+
+    def set_quantity(self, cart_id, item_id, quantity, unit_price):
+        item = CartItem.query.filter_by(id=item_id, session_id=cart_id).first()
+        if not item:
+            return False
+        item.quantity = quantity
+        db.session.commit()
+        return True
+
+    def remove(self, cart_id, item_id):
+        removed = CartItem.query.filter_by(id=item_id, session_id=cart_id).delete()
+        if removed:
+            # The removed line may have been the newest; keep the rest as fresh as the cart cookie
+            self._touch(cart_id)
+        db.session.commit()
+        return removed > 0
+
+    def clear(self, cart_id):
+        CartItem.query.filter_by(session_id=cart_id).delete()
+        db.session.commit()
+
+    def _touch(self, cart_id):
+        CartItem.query.filter_by(session_id=cart_id).update(
+            {CartItem.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+
+    def touch(self, cart_id):
+        self._touch(cart_id)
+        db.session.commit()
+
+    def summary(self, cart_id):
+        count, quantity, total = db.session.query(
+            func.count(CartItem.id),
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.coalesce(func.sum(CartItem.quantity * Product.price), 0)
+        ).outerjoin(Product, Product.id == CartItem.product_id).filter(
+            CartItem.session_id == cart_id
+        ).one()
+        return {'count': count, 'quantity': int(quantity), 'total': round(float(total), 2)}
+
+    def claim(self, cart_id, lines):
+        claimed = db.session.execute(
+            delete(CartItem)
+            .where(CartItem.session_id == cart_id, CartItem.id.in_([line['id'] for line in lines]))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        return claimed == len(lines)
+
+    def restore(self, cart_id, lines):
+        pass  # The checkout rollback restores the deleted rows
+
+class MemoryCartStore(CartStore):
+    """Carts in a per-process dict, expired after ``ttl`` seconds idle"""
+    name = 'memory'
+
+    def __init__(self, ttl=DEFAULT_CART_TTL):
+        self.ttl = ttl
+        self._carts = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _cart(self, cart_id, create=False):
+        now = time.monotonic()
+        if now - self._last_sweep > 60:
+            self._carts = {key: cart for key, cart in self._carts.items() if cart['expires'] > now}
+            self._last_sweep = now
+
+        cart = self._carts.get(cart_id)
+        if cart is not None and cart['expires'] <= now:
+            del self._carts[cart_id]
+            cart = None
+        if cart is None and create:
+            cart = {'lines': {}, 'count': 0, 'quantity': 0, 'total': 0.0}
+            self._carts[cart_id] = cart
+        if cart is not None:
+            cart['expires'] = now + self.ttl
+        return cart
+
+    def _apply(self, cart, product_id, quantity, unit_price, created_at=None):
+        """Set a line's quantity (0 removes it) and adjust the running totals"""
+        line = cart['lines'].get(product_id)
+        if line:
+            cart['quantity'] -= line['quantity']
+            cart['total'] -= line['quantity'] * line['unit_price']
+            if quantity <= 0:
+                del cart['lines'][product_id]
+                cart['count'] -= 1
+                return
+            line['quantity'] = quantity
+            line['unit_price'] = unit_price
+        elif quantity > 0:
+            line = {
+                'id': product_id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'created_at': created_at or datetime.utcnow()
+            }
+            cart['lines'][product_id] = line
+            cart['count'] += 1
+        else:
+            return
+        cart['quantity'] += quantity
+        cart['total'] += quantity * unit_price
+
+    def lines(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return [dict(line) for line in cart['lines'].values()] if cart else []
+
+    def get_line(self, cart_id, item_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            line = cart['lines'].get(item_id) if cart else None
+            return dict(line) if line else None
+
+    def add(self, cart_id, product_id, quantity, unit_price):
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            existing = cart['lines'].get(product_id)
+            self._apply(cart, product_id, quantity + (existing['quantity'] if existing else 0), unit_price)
+            return dict(cart['lines'][product_id])
+
+    def set_quantity(self, cart_id, item_id, quantity, unit_price):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if not cart or item_id not in cart['lines']:
+                return False
+            self._apply(cart, item_id, quantity, unit_price)
+            return True
+
+    def remove(self, cart_id, item_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if not cart or item_id not in cart['lines']:
+                return False
+            self._apply(cart, item_id, 0, 0)
+            return True
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def touch(self, cart_id):
+        with self._lock:
+            self._cart(cart_id)
+
+    def summary(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if not cart:
+                return {'count': 0, 'quantity': 0, 'total': 0.0}
+            return {'count': cart['count'], 'quantity': cart['quantity'], 'total': round(cart['total'], 2)}
+
+    def claim(self, cart_id, lines):
+        with self._lock:
+            cart = self._cart(cart_id)
+            if not cart or _line_key(cart['lines'].values()) != _line_key(lines):
+                return False
+            del self._carts[cart_id]
+            return True
+
+    def restore(self, cart_id, lines):
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            for line in lines:
+                existing = cart['lines'].get(line['product_id'])
+                quantity = line['quantity'] + (existing['quantity'] if existing else 0)
+                self._apply(cart, line['product_id'], quantity, line['unit_price'] or 0, line['created_at'])
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.name, 'carts': len(self._carts)}
+
+class RedisCartStore(CartStore):
+    """Carts as Redis hashes, one key per cart.
+
+    Each line is stored as ``q:<product_id>`` (quantity), ``p:<product_id>``
+    (unit price) and ``t:<product_id>`` (added-at timestamp), next to running
+    ``count``, ``quantity`` and ``total`` fields. Writes use WATCH/MULTI so
+    concurrent requests on the same cart can't corrupt the totals.
+    """
+    name = 'redis'
+
+    def __init__(self, url=None, client=None, ttl=DEFAULT_CART_TTL, prefix='cart:'):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, cart_id):
+        return f'{self.prefix}{cart_id}'
+
+    @staticmethod
+    def _decode(raw):
+        fields = {
+            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in raw.items()
+        }
+        lines = []
+        for field, quantity in fields.items():
+            if not field.startswith('q:'):
+                continue
+            product_id = int(field[2:])
+            lines.append({
+                'id': product_id,
+                'product_id': product_id,
+                'quantity': int(quantity),
+                'unit_price': float(fields.get(f'p:{product_id}', 0)),
+                'created_at': datetime.utcfromtimestamp(float(fields.get(f't:{product_id}', 0)))
+            })
+        lines.sort(key=lambda line: (line['created_at'], line['product_id']))
+        return fields, lines
+
+    def _write(self, cart_id, change):
+        """Run ``change(fields, lines, pipe)`` under WATCH and return its result"""
+        import redis
+        key = self._key(cart_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    fields, lines = self._decode(pipe.hgetall(key))
+                    pipe.multi()
+                    result = change(fields, lines, pipe, key)
+                    pipe.expire(key, int(self.ttl))
+                    pipe.execute()
+                    return result
+                except redis.WatchError:
+                    continue
+
+    def _set_line(self, pipe, key, fields, product_id, quantity, unit_price, added_at=None):
+        old_quantity = int(fields.get(f'q:{product_id}', 0))
+        old_price = float(fields.get(f'p:{product_id}', 0))
+        delta_total = quantity * unit_price - old_quantity * old_price
+        if quantity > 0:
+            pipe.hset(key, mapping={f'q:{product_id}': quantity, f'p:{product_id}': unit_price})
+            if not old_quantity:
+                pipe.hset(key, f't:{product_id}', added_at or time.time())
+                pipe.hincrby(key, 'count', 1)
+        elif old_quantity:
+            pipe.hdel(key, f'q:{product_id}', f'p:{product_id}', f't:{product_id}')
+            pipe.hincrby(key, 'count', -1)
+        pipe.hincrby(key, 'quantity', quantity - old_quantity)
+        pipe.hincrbyfloat(key, 'total', delta_total)
+
+    def lines(self, cart_id):
+        return self._decode(self.client.hgetall(self._key(cart_id)))[1]
+
+    def get_line(self, cart_id, item_id):
+        for line in self.lines(cart_id):
+            if line['id'] == item_id:
+                return line
+        return None
+
+    def add(self, cart_id, product_id, quantity, unit_price):
+        def change(fields, lines, pipe, key):
+            new_quantity = int(fields.get(f'q:{product_id}', 0)) + quantity
+            self._set_line(pipe, key, fields, product_id, new_quantity, unit_price)
+            return {'id': product_id, 'product_id': product_id, 'quantity': new_quantity, 'unit_price': unit_price}
+        return self._write(cart_id, change)
+
+    def set_quantity(self, cart_id, item_id, quantity, unit_price):
+        def change(fields, lines, pipe, key):
+            if f'q:{item_id}' not in fields:
+                return False
+            self._set_line(pipe, key, fields, item_id, quantity, unit_price)
+            return True
+        return self._write(cart_id, change)
+
+    def remove(self, cart_id, item_id):
+        return self.set_quantity(cart_id, item_id, 0, 0)
+
+    def clear(self, cart_id):
+        self.client.delete(self._key(cart_id))
+
+    def touch(self, cart_id):
+        self.client.expire(self._key(cart_id), int(self.ttl))
+
+    def summary(self, cart_id):
+        count, quantity, total = self.client.hmget(self._key(cart_id), 'count', 'quantity', 'total')
+        return {
+            'count': int(count or 0),
+            'quantity': int(quantity or 0),
+            'total': round(float(total or 0), 2)
+        }
+
+    def claim(self, cart_id, lines):
+        import redis
+        key = self._key(cart_id)
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if _line_key(self._decode(pipe.hgetall(key))[1]) != _line_key(lines):
+                    return False
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def restore(self, cart_id, lines):
+        def change(fields, current, pipe, key):
+            for line in lines:
+                quantity = line['quantity'] + int(fields.get(f"q:{line['product_id']}", 0))
+                self._set_line(
+                    pipe, key, fields, line['product_id'], quantity, line['unit_price'] or 0,
+                    line['created_at'].replace(tzinfo=timezone.utc).timestamp() if line.get('created_at') else None
+                )
+        self._write(cart_id, change)
+
+def create_cart_store(config):
+    """Build the cart backend selected by ``CART_STORE`` in ``config``"""
+    backend = config.get('CART_STORE', 'sql')
+    ttl = float(config.get('CART_TTL', DEFAULT_CART_TTL))
+    if backend == 'memory':
+        return MemoryCartStore(ttl=ttl)
+    if backend == 'redis':
+        return RedisCartStore(url=config.get('CART_REDIS_URL', 'redis://localhost:6379/0'), ttl=ttl)
+    if backend == 'sql':
+        return SQLCartStore()
+    raise ValueError(f'Unknown CART_STORE: {backend}')
+
+def get_cart_store():
+    """Return the cart store for the current app, creating it on first use"""
+    store = current_app.extensions.get('cart_store')
+    if store is None:
+        store = current_app.extensions['cart_store'] = create_cart_store(current_app.config)
+    return store
@@ -0,0 +1,153 @@
+"""
+Catalog versioning and HTTP conditional responses.
+
+A single ``catalog_version`` row is bumped once, just before commit, in any
+transaction that writes products, whether through the ORM unit of work or
+a bulk ``update``/``delete``. Public catalog endpoints derive a strong
+ETag and Last-Modified from it, so a revalidating client can be answered
+with a 304 after one primary-key lookup, before the catalog is queried or
+serialized. Being in the database, the version is shared by all workers;
+the in-process ``catalog_cache`` is per worker, so its keys for these
+endpoints include the version too, or one worker could serve an old body
+under the new ETag.
+
+Each product row also carries its own ``version``, incremented in SQL by
+the same writes, which keys the serialized-fragment cache of
+``src/serialization.py`` and the ETag of a single product.
+
+Checkout's stock decrements (statements run with the ``stock_only``
+execution option) leave the catalog version alone, so orders neither
+queue on its row lock nor invalidate every catalog ETag. They bump one of
+``STOCK_VERSION_SHARDS`` ``stock_version`` rows, chosen at random, whose
+sum keys caches that must follow stock exactly (admin analytics).
+Listings show stock but are only revalidated every ``CATALOG_STOCK_TTL``
+seconds (``stock_window``); checkout enforces the real stock level and
+product pages are exact.
+"""
+import random
+import time
+from datetime import datetime, timezone
+from flask import current_app, request, make_response
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.models.product import Product, CatalogVersion, StockVersion
+
+CATALOG_VERSION_ID = 1
+STOCK_VERSION_SHARDS = 16
+
+def bump_catalog_version(connection):
+    """Increment the catalog version on ``connection``"""
+    connection.execute(
+        update(CatalogVersion.__table__)
+        .where(CatalogVersion.__table__.c.id == CATALOG_VERSION_ID)
+        .values(version=CatalogVersion.__table__.c.version + 1, updated_at=datetime.utcnow())
+    )
+
+def bump_stock_version(connection):
+    """Increment a random ``stock_version`` shard on ``connection``"""
+    table = StockVersion.__table__
+    connection.execute(
+        update(table).where(table.c.shard == random.randrange(STOCK_VERSION_SHARDS))
+        .values(version=table.c.version + 1)
+    )
+
+@event.listens_for(Session, 'before_flush')
+def _bump_product_versions(session, flush_context, instances):
+    for product in session.dirty:
+        if isinstance(product, Product) and session.is_modified(product, include_collections=False):
+            # An SQL expression, so concurrent writers can't both write the same version
+            product.version = Product.version + 1
+
+@event.listens_for(Session, 'after_flush')
+def _mark_on_flush(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, Product) for obj in changed):
+        session.info['catalog_changed'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_on_bulk_write(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and \
+            orm_execute_state.bind_mapper is Product.__mapper__:
+        if orm_execute_state.execution_options.get('stock_only'):
+            orm_execute_state.session.info['stock_changed'] = True
+        else:
+            orm_execute_state.session.info['catalog_changed'] = True
+        if orm_execute_state.is_update:
+            orm_execute_state.statement = orm_execute_state.statement.values(version=Product.version + 1)
+
+@event.listens_for(Session, 'before_commit')
+def _bump_before_commit(session):
+    # Bump once per transaction and last, so the version row is always the
+    # final lock taken and never interleaves with product row locks.
+    # A catalog bump also covers stock: every cache keyed on the stock
+    # version is keyed on the catalog version too.
+    session.flush()
+    stock_changed = session.info.pop('stock_changed', False)
+    if session.info.pop('catalog_changed', False):
+        bump_catalog_version(session.connection())
+    elif stock_changed:
+        bump_stock_version(session.connection())
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('catalog_changed', None)
+    session.info.pop('stock_changed', None)
+
+def ensure_catalog_version():
+    """Create the version rows if this database doesn't have them yet"""
+    if db.session.get(CatalogVersion, CATALOG_VERSION_ID) is None:
+        db.session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=0))
+    existing = {shard for shard, in db.session.query(StockVersion.shard)}
+    db.session.add_all(
+        StockVersion(shard=shard, version=0) for shard in range(STOCK_VERSION_SHARDS) if shard not in existing
+    )
+    db.session.commit()
+
+def current_catalog_version():
+    """Return ``(version, last_modified)`` for the catalog"""
+    row = db.session.query(CatalogVersion.version, CatalogVersion.updated_at).filter(
+        CatalogVersion.id == CATALOG_VERSION_ID
+    ).first()
+    if row is None:
+        return 0, None
+    last_modified = row.updated_at.replace(microsecond=0, tzinfo=timezone.utc) if row.updated_at else None
+    return row.version, last_modified
+
+def current_stock_version():
+    """Return the number of checkout stock writes so far"""
+    return db.session.query(func.coalesce(func.sum(StockVersion.version), 0)).scalar()
+
+def stock_window():
+    """Return ``(window, started)`` for the current ``CATALOG_STOCK_TTL`` period.
+
+    Listing ETags and cache keys include the window, so stock changed by
+    checkout shows up in listings within ``CATALOG_STOCK_TTL`` seconds.
+    """
+    ttl = max(1, current_app.config.get('CATALOG_STOCK_TTL', 60))
+    window = int(time.time() // ttl)
+    return window, datetime.fromtimestamp(window * ttl, timezone.utc)
+
+def is_not_modified(etag, last_modified):
+    """Check the request's validators against the current representation.
+
+    If-None-Match takes precedence over If-Modified-Since and uses weak
+    comparison, as in RFC 9110, so it matches the weak ETags that response
+    compression turns ours into.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+def with_validators(response, etag, last_modified):
+    """Attach ETag/Last-Modified and ask clients to revalidate before reuse"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def not_modified_response(etag, last_modified):
+    return with_validators(make_response('', 304), etag, last_modified)
@@ -0,0 +1,124 @@
+"""
+Negotiated response compression.
+
+``init_compression`` installs an ``after_request`` hook that gzip- or
+brotli-encodes (brotli only when the ``brotli`` package is installed)
+responses whose client sent a matching ``Accept-Encoding``. It leaves
+alone responses that are:
+
+- smaller than ``COMPRESS_MIN_SIZE`` bytes, where headers dominate;
+- not a compressible type (images, archives, ...);
+- already encoded, streamed or file-backed (static assets carry
+  precompressed variants, see ``src/static_files.py``);
+- marked ``Cache-Control: no-transform``.
+
+Counters, including the overall compression ratio, are exposed through
+``compression_stats`` for the admin metrics endpoint.
+"""
+import gzip
+import threading
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+class CompressionStats:
+    """Thread-safe counters of what the middleware did"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compressed = {}
+        self.skipped = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, encoding, size_in, size_out):
+        with self._lock:
+            self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+
+    def skip(self, reason):
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'compressed': dict(self.compressed),
+                'skipped': dict(self.skipped),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': self.bytes_in / self.bytes_out if self.bytes_out else None,
+                'bytes_saved': self.bytes_in - self.bytes_out
+            }
+
+def _choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def _skip_reason(response, min_size):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return 'status'
+    if response.direct_passthrough or response.is_streamed:
+        return 'streamed'
+    if 'Content-Encoding' in response.headers:
+        return 'encoded'
+    if not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+        return 'type'
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return 'no-transform'
+    if (response.content_length or 0) < min_size:
+        return 'small'
+    return None
+
+def init_compression(app):
+    """Compress eligible responses; does nothing if ``COMPRESS_ENABLED`` is off"""
+    stats = app.extensions['compression'] = CompressionStats()
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    gzip_level = app.config.get('COMPRESS_GZIP_LEVEL', 6)
+    brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+
+    @app.after_request
+    def _compress_response(response):
+        reason = _skip_reason(response, min_size)
+        if reason is None:
+            response.vary.add('Accept-Encoding')
+            encoding = _choose_encoding(request.accept_encodings)
+            if encoding is None:
+                reason = 'not-accepted'
+        if reason is not None:
+            stats.skip(reason)
+            return response
+
+        body = response.get_data()
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        if len(compressed) >= len(body):
+            stats.skip('incompressible')
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, _ = response.get_etag()
+        if etag:
+            # The bytes now differ per encoding, so the validator may only be weak
+            response.set_etag(etag, weak=True)
+        stats.record(encoding, len(body), len(compressed))
+        return response
+
+def compression_stats(app):
+    return app.extensions['compression'].to_dict()
@@ -0,0 +1,133 @@
+"""
+Read-replica routing and connection pool settings.
+
+With ``DATABASE_READ_URL`` set, the replica is registered as the
+``replica`` bind and views decorated with ``@read_replica`` (catalog and
+order-history GETs) run their SELECTs there. Everything else stays on the
+primary:
+
+- flushes, bulk writes and any read after a write in the same session;
+- the Flask session table, which is read and saved outside the view;
+- every request within ``DATABASE_READ_PIN_SECONDS`` of a write by the
+  same client, tracked with a short-lived cookie, so a client reads its
+  own writes while the replica catches up.
+
+Without a replica the decorator does nothing. ``engine_options`` builds
+``SQLALCHEMY_ENGINE_OPTIONS`` (applied to both engines) from the ``DB_POOL_*``
+variables, and ``pool_stats`` reports each engine's pool for the admin
+metrics endpoint.
+"""
+import threading
+import time
+from functools import wraps
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event
+from sqlalchemy.orm import Session as BaseSession
+
+REPLICA_BIND = 'replica'
+PIN_COOKIE = 'db_primary_until'
+
+class RoutingSession(Session):
+    """Sends SELECTs to the replica while a ``@read_replica`` view runs"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and self.info.get('read_replica') \
+                and not self.info.get('wrote') and not self._flushing:
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(BaseSession, 'after_flush')
+def _mark_written(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(BaseSession, 'do_orm_execute')
+def _mark_bulk_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+class RoutingStats:
+    """Thread-safe counts of where routable requests were sent"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.replica = 0
+        self.pinned = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_dict(self):
+        with self._lock:
+            return {'replica': self.replica, 'pinned_to_primary': self.pinned}
+
+def _pinned_to_primary():
+    try:
+        return float(request.cookies.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def read_replica(view):
+    """Run ``view``'s reads on the replica unless this client recently wrote"""
+    @wraps(view)
+    def decorated_function(*args, **kwargs):
+        db = current_app.extensions['sqlalchemy']
+        if REPLICA_BIND not in db.engines or request.method != 'GET':
+            return view(*args, **kwargs)
+        stats = current_app.extensions['db_routing']
+        if _pinned_to_primary():
+            stats.count('pinned')
+            return view(*args, **kwargs)
+
+        stats.count('replica')
+        session = db.session()
+        session.info['read_replica'] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            session.info.pop('read_replica', None)
+    return decorated_function
+
+def init_db_routing(app):
+    """Pin clients that just wrote to the primary; a no-op without a replica"""
+    app.extensions['db_routing'] = RoutingStats()
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    @app.after_request
+    def _pin_after_write(response):
+        db = app.extensions['sqlalchemy']
+        if db.session().info.get('wrote'):
+            seconds = app.config.get('DATABASE_READ_PIN_SECONDS', 5)
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=int(seconds) + 1, httponly=True,
+                secure=app.config.get('SESSION_COOKIE_SECURE', False),
+                samesite=app.config.get('SESSION_COOKIE_SAMESITE')
+            )
+        return response
+
+def engine_options(environ):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` from ``DB_POOL_*`` variables in ``environ``"""
+    options = {
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    for name, option in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'),
+                         ('DB_POOL_TIMEOUT', 'pool_timeout')):
+        if environ.get(name):
+            options[option] = int(environ[name])
+    return options
+
+def pool_stats(app):
+    """Pool occupancy per engine plus replica routing counters"""
+    db = app.extensions['sqlalchemy']
+    pools = {}
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        stats = {'class': type(pool).__name__, 'status': pool.status()}
+        if hasattr(pool, 'checkedout'):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                         checked_out=pool.checkedout(), overflow=pool.overflow())
+        pools[key or 'primary'] = stats
+    return {'pools': pools, 'routing': app.extensions['db_routing'].to_dict()}
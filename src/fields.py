@@ -0,0 +1,86 @@
+"""
+Sparse fieldsets (``?fields=id,name,price``) for product and order endpoints.
+
+``parse_fields`` validates the parameter against a model's serializable
+fields; ``product_columns``/``order_load_options`` turn the selection into
+``load_only`` loader options so unrequested columns, and for orders the
+item and product relationships, are never fetched. ``to_dict(fields)`` on
+the models then serializes just those keys.
+"""
+from sqlalchemy.orm import load_only, selectinload
+from src.models.product import Product, Order, OrderItem
+
+# Serialized field -> columns it is computed from
+PRODUCT_FIELD_COLUMNS = {
+    'id': ['id'],
+    'name': ['name'],
+    'description': ['description'],
+    'price': ['price'],
+    'image_url': ['image_url'],
+    'image_renditions': ['image_url'],
+    'category': ['category'],
+    'stock_quantity': ['stock_quantity'],
+    'created_at': ['created_at'],
+    'is_active': ['is_active'],
+}
+
+ORDER_FIELD_COLUMNS = {
+    'id': ['id'],
+    'order_number': ['order_number'],
+    'customer_name': ['customer_name'],
+    'customer_email': ['customer_email'],
+    'shipping_address': ['shipping_address'],
+    'total_amount': ['total_amount'],
+    'status': ['status'],
+    'created_at': ['created_at'],
+    'items': [],
+}
+
+def parse_fields(raw, allowed):
+    """Return the requested field names as a frozenset, or None for all fields.
+
+    Raises ValueError naming any field not in ``allowed``.
+    """
+    if raw is None or not raw.strip():
+        return None
+    fields = frozenset(field.strip() for field in raw.split(',') if field.strip())
+    unknown = sorted(fields - set(allowed))
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return fields
+
+def _columns(model, field_columns, fields, required=()):
+    names = {'id', *required}
+    for field in fields:
+        names.update(field_columns[field])
+    return [getattr(model, name) for name in sorted(names)]
+
+def product_columns(fields, required=()):
+    """``load_only`` option for ``Product`` covering ``fields`` (None = all columns).
+
+    ``required`` names columns the query itself needs, e.g. a sort key.
+    ``version`` is always loaded so the product can use the fragment cache.
+    """
+    if fields is None:
+        return None
+    return load_only(*_columns(Product, PRODUCT_FIELD_COLUMNS, fields, ('version', *required)))
+
+def order_load_options(fields=None, product_fields=None):
+    """Loader options for an Order query serialized with ``to_dict(fields, product_fields)``"""
+    options = []
+    if fields is not None:
+        options.append(load_only(*_columns(Order, ORDER_FIELD_COLUMNS, fields, ('created_at',))))
+    if fields is None or 'items' in fields:
+        products = selectinload(Order.items).selectinload(OrderItem.product)
+        if product_fields is not None:
+            products = products.options(product_columns(product_fields))
+        options.append(products)
+    return options
+
+def request_product_fields(args, name='fields'):
+    return parse_fields(args.get(name), PRODUCT_FIELD_COLUMNS)
+
+def request_order_fields(args):
+    """Return ``(fields, product_fields)`` from ``fields=`` and ``product_fields=``"""
+    return (parse_fields(args.get('fields'), ORDER_FIELD_COLUMNS),
+            request_product_fields(args, 'product_fields'))
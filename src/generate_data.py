@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Generate a large synthetic catalog, order history and set of live carts.
+
+Sizes scale linearly with ``--scale``; one unit is 10k products, 100k
+orders (about 2.5 items each) and 1k carts, so ``--scale 100`` produces 1M
+products, 10M orders, ~25M order items and 100k carts. Output is fully
+determined by ``--seed`` and ``--anchor-date``.
+
+Rows are streamed in chunks through ``COPY`` on PostgreSQL and Core
+``executemany`` inserts elsewhere, never through the ORM unit of work, so
+the order statistics rollups are rebuilt afterwards.
+
+Usage:
+    python src/generate_data.py --scale 1
+    python src/generate_data.py --products 1000000 --orders 0 --carts 0
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import func, text
+from src.models.user import db
+from src.models.product import Product, Order, OrderItem, CartItem
+from src.catalog_version import bump_catalog_version
+from src.order_stats import rebuild_order_stats
+
+PRODUCTS_PER_SCALE = 10_000
+ORDERS_PER_SCALE = 100_000
+CARTS_PER_SCALE = 1_000
+CHUNK_SIZE = 10_000
+
+PRODUCT_COLUMNS = ['id', 'name', 'description', 'price', 'image_url', 'category', 'stock_quantity', 'created_at', 'is_active']
+ORDER_COLUMNS = ['id', 'order_number', 'customer_name', 'customer_email', 'shipping_address', 'total_amount', 'status', 'created_at']
+ORDER_ITEM_COLUMNS = ['order_id', 'product_id', 'quantity', 'price']
+CART_ITEM_COLUMNS = ['session_id', 'product_id', 'quantity', 'created_at', 'updated_at']
+
+# (category, share of catalog, median price)
+CATEGORIES = [
+    ('Electronics', 0.22, 120.0),
+    ('Clothing', 0.20, 40.0),
+    ('Home & Garden', 0.15, 55.0),
+    ('Sports & Fitness', 0.12, 60.0),
+    ('Kitchen', 0.10, 45.0),
+    ('Accessories', 0.10, 35.0),
+    ('Beauty', 0.06, 25.0),
+    ('Toys', 0.05, 30.0),
+]
+
+ORDER_STATUSES = [
+    ('delivered', 0.55), ('confirmed', 0.15), ('shipped', 0.10),
+    ('processing', 0.08), ('cancelled', 0.07), ('pending', 0.05),
+]
+
+ADJECTIVES = ['Wireless', 'Premium', 'Compact', 'Durable', 'Smart', 'Classic', 'Portable', 'Organic',
+              'Ergonomic', 'Waterproof', 'Vintage', 'Modern', 'Lightweight', 'Deluxe', 'Eco', 'Pro']
+MATERIALS = ['Steel', 'Leather', 'Cotton', 'Bamboo', 'Ceramic', 'Aluminium', 'Wool', 'Glass', 'Carbon']
+NOUNS = {
+    'Electronics': ['Headphones', 'Speaker', 'Charger', 'Keyboard', 'Mouse', 'Camera', 'Smartwatch', 'Monitor'],
+    'Clothing': ['T-Shirt', 'Jacket', 'Hoodie', 'Jeans', 'Sweater', 'Scarf', 'Socks', 'Dress'],
+    'Home & Garden': ['Lamp', 'Planter', 'Rug', 'Cushion', 'Vase', 'Clock', 'Mirror', 'Hose'],
+    'Sports & Fitness': ['Yoga Mat', 'Dumbbell', 'Running Shoes', 'Water Bottle', 'Tent', 'Bike Light'],
+    'Kitchen': ['Coffee Maker', 'Kettle', 'Blender', 'Knife Set', 'Pan', 'Mug', 'Cutting Board'],
+    'Accessories': ['Backpack', 'Wallet', 'Sunglasses', 'Belt', 'Laptop Bag', 'Phone Case'],
+    'Beauty': ['Face Cream', 'Shampoo', 'Perfume', 'Hair Dryer', 'Lip Balm'],
+    'Toys': ['Puzzle', 'Board Game', 'Building Blocks', 'Plush Bear', 'Kite'],
+}
+DESCRIPTION_PHRASES = [
+    'Built to last with premium materials.', 'Perfect for everyday use.', 'Ships in eco-friendly packaging.',
+    'Designed for comfort and style.', 'Backed by a two-year warranty.', 'Easy to clean and maintain.',
+    'A customer favourite this season.', 'Lightweight and travel ready.', 'Available in multiple colors.',
+]
+
+def _weighted(rng, choices):
+    point = rng.random()
+    for value, weight in choices:
+        point -= weight
+        if point <= 0:
+            return value
+    return choices[-1][0]
+
+def _price(rng, median):
+    return max(0.99, round(rng.lognormvariate(0, 0.6) * median) - 0.01)
+
+def _stock(rng):
+    roll = rng.random()
+    if roll < 0.05:
+        return 0
+    if roll < 0.15:
+        return rng.randint(1, 9)
+    return rng.randint(10, 500)
+
+def generate_products(rng, first_id, count, now):
+    """Yield product rows plus (id, price) pairs used for orders and carts"""
+    category_choices = [(category, share) for category, share, _ in CATEGORIES]
+    medians = {category: median for category, _, median in CATEGORIES}
+    for product_id in range(first_id, first_id + count):
+        category = _weighted(rng, category_choices)
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(MATERIALS)} {rng.choice(NOUNS[category])}'
+        yield (
+            product_id,
+            name,
+            ' '.join(rng.sample(DESCRIPTION_PHRASES, 3)),
+            _price(rng, medians[category]),
+            f'https://picsum.photos/seed/{product_id}/400/300',
+            category,
+            _stock(rng),
+            now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400)),
+            rng.random() < 0.97
+        )
+
+def _popular_index(rng, size):
+    # Skewed towards low indexes so a few products dominate sales
+    return int(size * rng.random() ** 3)
+
+def generate_orders(rng, first_id, count, items_per_order, products, now):
+    """Yield ``(order_row, item_rows)`` pairs"""
+    customers = max(1, count // 5)
+    for order_id in range(first_id, first_id + count):
+        customer = rng.randrange(customers)
+        total = 0.0
+        items = []
+        for _ in range(max(1, int(rng.expovariate(1 / items_per_order) + 0.5))):
+            product_id, price = products[_popular_index(rng, len(products))]
+            quantity = 1 if rng.random() < 0.8 else rng.randint(2, 4)
+            total += price * quantity
+            items.append((order_id, product_id, quantity, price))
+        yield (
+            order_id,
+            f'GEN-{order_id:010d}',
+            f'Customer {customer}',
+            f'customer{customer}@example.com',
+            f'{rng.randint(1, 9999)} Market Street, Springfield',
+            round(total, 2),
+            _weighted(rng, ORDER_STATUSES),
+            now - timedelta(seconds=rng.randint(0, 365 * 86400))
+        ), items
+
+def generate_carts(rng, count, products, now):
+    """Yield cart lines; about one cart in seven was last changed longer ago than the default ``CART_TTL``"""
+    for _ in range(count):
+        session_id = '%032x' % rng.getrandbits(128)
+        age = rng.randint(0, 14 * 86400)
+        created_at = now - timedelta(seconds=age)
+        updated_at = created_at + timedelta(seconds=rng.randint(0, age))
+        for product_id, _ in sorted({products[_popular_index(rng, len(products))] for _ in range(rng.randint(1, 6))}):
+            yield (session_id, product_id, rng.randint(1, 3), created_at, updated_at)
+
+def _chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def bulk_load(connection, table, columns, rows):
+    """Stream ``rows`` (tuples in ``columns`` order) into ``table``; returns the row count"""
+    loaded = 0
+    if connection.dialect.name == 'postgresql':
+        quoted_table = connection.dialect.identifier_preparer.format_table(table)
+        copy_sql = f"COPY {quoted_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        cursor = connection.connection.cursor()
+        for chunk in _chunks(rows):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            loaded += len(chunk)
+        return loaded
+
+    statement = table.insert()
+    for chunk in _chunks(rows):
+        connection.execute(statement, [dict(zip(columns, row)) for row in chunk])
+        loaded += len(chunk)
+    return loaded
+
+def _next_id(connection, model):
+    return (connection.execute(db.select(func.max(model.id))).scalar() or 0) + 1
+
+def _reset_sequences(connection, tables):
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        quoted = connection.dialect.identifier_preparer.format_table(table)
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{quoted}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {quoted}))"
+        ))
+
+def _timed(label, load):
+    start = time.perf_counter()
+    count = load()
+    elapsed = time.perf_counter() - start
+    print(f'{label:12s} {count:>12,d} rows in {elapsed:7.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)')
+    return count
+
+def generate(products, orders, carts, items_per_order=2.5, seed=42, anchor=None):
+    """Append the requested volume of synthetic data to the bound database.
+
+    Timestamps are spread backwards from ``anchor`` (default: today at
+    midnight UTC); the same seed and anchor always produce the same rows.
+    """
+    rng = random.Random(seed)
+    now = anchor or datetime.combine(datetime.utcnow().date(), datetime.min.time())
+
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA synchronous = OFF')
+
+        first_product_id = _next_id(connection, Product)
+        product_prices = []
+
+        def product_rows():
+            for row in generate_products(rng, first_product_id, products, now):
+                if row[8]:
+                    product_prices.append((row[0], row[3]))
+                yield row
+
+        _timed('products', lambda: bulk_load(
+            connection, Product.__table__, PRODUCT_COLUMNS, product_rows()
+        ))
+
+        if not product_prices:
+            product_prices = [tuple(row) for row in connection.execute(
+                db.select(Product.id, Product.price).where(Product.is_active == True)
+            )]
+
+        if orders and product_prices:
+            order_batches = _chunks(generate_orders(
+                rng, _next_id(connection, Order), orders, items_per_order, product_prices, now
+            ))
+            item_count = [0]
+
+            def load_orders():
+                loaded = 0
+                for batch in order_batches:
+                    loaded += bulk_load(connection, Order.__table__, ORDER_COLUMNS, [order for order, _ in batch])
+                    item_count[0] += bulk_load(
+                        connection, OrderItem.__table__, ORDER_ITEM_COLUMNS,
+                        [item for _, items in batch for item in items]
+                    )
+                return loaded
+
+            _timed('orders', load_orders)
+            print(f"{'order items':12s} {item_count[0]:>12,d} rows")
+
+        if carts and product_prices:
+            _timed('cart items', lambda: bulk_load(
+                connection, CartItem.__table__, CART_ITEM_COLUMNS,
+                generate_carts(rng, carts, product_prices, now)
+            ))
+
+        _reset_sequences(connection, [Product.__table__, Order.__table__, OrderItem.__table__, CartItem.__table__])
+        bump_catalog_version(connection)
+        if orders:
+            rebuild_order_stats(connection)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='Size multiplier (1 = 10k products, 100k orders, 1k carts)')
+    parser.add_argument('--products', type=int, help='Override the number of products')
+    parser.add_argument('--orders', type=int, help='Override the number of orders')
+    parser.add_argument('--carts', type=int, help='Override the number of live carts')
+    parser.add_argument('--items-per-order', type=float, default=2.5, help='Mean items per order')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor-date', type=datetime.fromisoformat,
+                        help='Date timestamps count back from (default: today)')
+    args = parser.parse_args(argv)
+
+    products = args.products if args.products is not None else int(PRODUCTS_PER_SCALE * args.scale)
+    orders = args.orders if args.orders is not None else int(ORDERS_PER_SCALE * args.scale)
+    carts = args.carts if args.carts is not None else int(CARTS_PER_SCALE * args.scale)
+
+    from src.main import app
+    from src.manage import init_database
+    init_database(app, seed=False)
+    with app.app_context():
+        start = time.perf_counter()
+        generate(products, orders, carts, args.items_per_order, args.seed, args.anchor_date)
+        print(f'Done in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()
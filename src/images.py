@@ -0,0 +1,366 @@
+"""
+Product image renditions, produced off the request path.
+
+An upload is saved as ``<stem>_original.<ext>`` and handed to a process
+pool, which writes every rendition in JPEG and WebP:
+
+- ``<stem>_thumb.jpg`` / ``.webp``: fits 150x150
+- ``<stem>_listing.jpg`` / ``.webp``: fits 400x300
+- ``<stem>.jpg`` / ``.webp``: detail, fits 800x600
+
+followed by ``<stem>.json``, a manifest of what was written. The detail
+JPEG URL is what goes in ``Product.image_url``; the other renditions are
+derived from it with ``rendition_urls``. The job id is the stem, and job
+state lives on disk, so any worker can answer a status poll:
+manifest present means done, ``<stem>.error`` means failed, otherwise the
+job is still pending.
+
+``IMAGE_WORKERS`` sets the pool size; 0 processes uploads inline.
+
+Other sizes are made on request (``?w=400&format=webp``) from an allowlist
+of widths and kept in a size-bounded LRU ``DerivativeCache`` on disk
+(``IMAGE_CACHE_DIR``, ``IMAGE_CACHE_MAX_MB``).
+"""
+import json
+import multiprocessing
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows: derivative generation is only coalesced per process
+    fcntl = None
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+RENDITIONS = {
+    'thumb': (150, 150),
+    'listing': (400, 300),
+    'detail': (800, 600),
+}
+FORMATS = {'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+           'webp': ('WEBP', {'quality': 80, 'method': 4})}
+
+UPLOAD_URL_PREFIX = '/api/uploads/products/'
+RENDITION_NAME = re.compile(r'^(?P<stem>[0-9a-f]{32,64})(?:_(?P<rendition>thumb|listing))?\.(?P<format>jpg|webp)$')
+
+def upload_folder():
+    return os.path.join(current_app.static_folder, 'uploads', 'products')
+
+def rendition_filename(stem, rendition, fmt):
+    suffix = '' if rendition == 'detail' else f'_{rendition}'
+    return f'{stem}{suffix}.{fmt}'
+
+def rendition_urls(image_url):
+    """Map an uploaded image's URL to the URLs of its whole rendition set.
+
+    Returns None for images that were not uploaded here.
+    """
+    if not image_url or not image_url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    match = RENDITION_NAME.match(image_url[len(UPLOAD_URL_PREFIX):])
+    if not match:
+        return None
+    stem = match.group('stem')
+    return {
+        rendition: {fmt: UPLOAD_URL_PREFIX + rendition_filename(stem, rendition, fmt) for fmt in FORMATS}
+        for rendition in RENDITIONS
+    }
+
+def _write_atomic(path, write):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def render_renditions(source_path, folder, stem):
+    """Write every rendition of ``source_path``; runs in a pool process"""
+    from PIL import Image, ImageOps
+
+    largest = max(RENDITIONS.values())
+    manifest = {'source': os.path.basename(source_path), 'renditions': {}}
+    with Image.open(source_path) as img:
+        # Let the JPEG decoder downscale while decoding instead of afterwards
+        img.draft('RGB', largest)
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+
+        # Largest first, so each smaller rendition is resized from the previous one
+        for rendition, size in sorted(RENDITIONS.items(), key=lambda item: item[1], reverse=True):
+            img = img.copy()
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            files = {}
+            for fmt, (pil_format, options) in FORMATS.items():
+                frame = img.convert('RGB') if pil_format == 'JPEG' and img.mode != 'RGB' else img
+                filename = rendition_filename(stem, rendition, fmt)
+                _write_atomic(os.path.join(folder, filename),
+                              lambda path: frame.save(path, pil_format, **options))
+                files[fmt] = filename
+            manifest['renditions'][rendition] = {'width': img.width, 'height': img.height, **files}
+
+    def write_manifest(path):
+        with open(path, 'w') as f:
+            json.dump(manifest, f)
+
+    _write_atomic(os.path.join(folder, f'{stem}.json'), write_manifest)
+    return manifest
+
+def _get_pool(app):
+    pool = app.extensions.get('image_pool')
+    if pool is None:
+        # Forked rather than spawned: spawn and forkserver re-import the
+        # __main__ module, which under `python src/main.py` is the whole app.
+        # Children only run render_renditions and never touch inherited
+        # DB connections.
+        pool = app.extensions['image_pool'] = ProcessPoolExecutor(
+            max_workers=app.config['IMAGE_WORKERS'],
+            mp_context=multiprocessing.get_context('fork')
+        )
+    return pool
+
+def _record_failure(folder, stem, error):
+    with open(os.path.join(folder, f'{stem}.error'), 'w') as f:
+        f.write(str(error) or error.__class__.__name__)
+
+def submit_image_job(source_path, stem):
+    """Queue rendition generation for an uploaded original; returns the job id"""
+    app = current_app._get_current_object()
+    folder = upload_folder()
+
+    if not app.config.get('IMAGE_WORKERS'):
+        try:
+            render_renditions(source_path, folder, stem)
+        except Exception as e:
+            _record_failure(folder, stem, e)
+        return stem
+
+    def finished(future):
+        error = future.exception()
+        if error is not None:
+            app.logger.error('Image job %s failed: %s', stem, error)
+            _record_failure(folder, stem, error)
+
+    _get_pool(app).submit(render_renditions, source_path, folder, stem).add_done_callback(finished)
+    return stem
+
+def image_job_status(job_id):
+    """Return the job's state as a dict, or None if there is no such job"""
+    if not re.fullmatch(r'[0-9a-f]{32,64}', job_id):
+        return None
+    folder = upload_folder()
+    image_url = UPLOAD_URL_PREFIX + rendition_filename(job_id, 'detail', 'jpg')
+    status = {'job_id': job_id, 'image_url': image_url}
+
+    manifest_path = os.path.join(folder, f'{job_id}.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return {**status, 'status': 'done', 'renditions': rendition_urls(image_url),
+                'dimensions': {name: [info['width'], info['height']] for name, info in manifest['renditions'].items()}}
+
+    error_path = os.path.join(folder, f'{job_id}.error')
+    if os.path.exists(error_path):
+        with open(error_path) as f:
+            return {**status, 'status': 'failed', 'error': f.read()}
+
+    if find_original(folder, job_id):
+        return {**status, 'status': 'pending'}
+    return None
+
+def find_original(folder, stem):
+    """Return the filename of the uploaded original for ``stem``, if kept"""
+    for extension in ALLOWED_EXTENSIONS:
+        name = f'{stem}_original.{extension}'
+        if os.path.exists(os.path.join(folder, name)):
+            return name
+    return None
+
+def rendition_set_files(folder, stem):
+    """Every file belonging to an upload: original, renditions and job markers"""
+    names = [rendition_filename(stem, rendition, fmt) for rendition in RENDITIONS for fmt in FORMATS]
+    names += [f'{stem}.json', f'{stem}.error']
+    original = find_original(folder, stem)
+    if original:
+        names.append(original)
+    return [name for name in names if os.path.exists(os.path.join(folder, name))]
+
+DERIVATIVE_WIDTHS = (150, 300, 400, 600, 800, 1200)
+DERIVATIVE_FORMATS = ('jpg', 'webp')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+LOCK_STRIPES = 64
+
+def render_derivative(source_path, path, width, fmt):
+    """Write ``source_path`` scaled down to ``width`` pixels wide as ``fmt``"""
+    from PIL import Image, ImageOps
+
+    pil_format, options = FORMATS[fmt]
+    with Image.open(source_path) as img:
+        img.draft('RGB', (width, width * 4))
+        img = ImageOps.exif_transpose(img)
+        if width < img.width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+        if pil_format == 'JPEG' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        _write_atomic(path, lambda temp_path: img.save(temp_path, pil_format, **options))
+
+class DerivativeCache:
+    """Size-bounded LRU cache of generated images on local disk.
+
+    Recency is the file's mtime, touched on every hit. When the bytes
+    written push the directory past ``max_bytes`` the least recently used
+    files are evicted down to 90% of it. Concurrent requests for the same
+    missing derivative are coalesced: one renders while the rest wait,
+    across threads via a per-key lock and across processes via ``flock``.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = [threading.Lock(), 0]
+            lock[1] += 1
+            return lock
+
+    def _release_key_lock(self, key, lock):
+        with self._lock:
+            lock[1] -= 1
+            if not lock[1]:
+                del self._key_locks[key]
+
+    def get_or_create(self, key, render):
+        """Return the path for ``key``, calling ``render(path)`` if it isn't cached"""
+        path = os.path.join(self.directory, key)
+        if self._touch(path):
+            self.hits += 1
+            return path
+
+        lock = self._key_lock(key)
+        try:
+            with lock[0], _file_lock(self._lock_path(key)):
+                # Another thread or worker may have rendered it while we waited
+                if self._touch(path):
+                    self.hits += 1
+                    return path
+                self.misses += 1
+                render(path)
+
+            self._added(path)
+        finally:
+            self._release_key_lock(key, lock)
+        return path
+
+    def _lock_path(self, key):
+        # A fixed set of lock files shared by all keys, so none are left behind
+        return os.path.join(self.directory, f'.lock-{zlib.crc32(key.encode()) % LOCK_STRIPES}')
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.lock-') and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _added(self, added_path):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry[1] for entry in self._scan())
+            else:
+                self._size += os.path.getsize(added_path)
+            if self._size <= self.max_bytes:
+                return
+
+            # Rescan: other workers share the directory and our running total drifts
+            entries = sorted(self._scan())
+            self._size = sum(entry[1] for entry in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if self._size <= target:
+                    break
+                if path == added_path:
+                    # About to be served, even if it alone exceeds the budget
+                    continue
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                self._size -= size
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'max_bytes': self.max_bytes,
+            'size_bytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+@contextmanager
+def _file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def get_derivative_cache():
+    """Return the derivative cache for the current app, creating it on first use"""
+    cache = current_app.extensions.get('image_derivatives')
+    if cache is None:
+        cache = current_app.extensions['image_derivatives'] = DerivativeCache(
+            current_app.config['IMAGE_CACHE_DIR'], current_app.config['IMAGE_CACHE_MAX_BYTES']
+        )
+    return cache
+
+def derivative_path(folder, filename, width, fmt):
+    """Return the cached path of ``filename`` at ``width`` in ``fmt``, rendering it if needed.
+
+    Derivatives are made from the uploaded original when it is still around,
+    otherwise from ``filename`` itself. Returns None if neither exists.
+    """
+    match = RENDITION_NAME.match(filename)
+    stem = match.group('stem') if match else filename.rsplit('.', 1)[0]
+    source = (match and find_original(folder, stem)) or filename
+    source_path = os.path.join(folder, source)
+    if not os.path.exists(source_path):
+        return None
+
+    return get_derivative_cache().get_or_create(
+        f'{stem}_w{width}.{fmt}',
+        lambda path: render_derivative(source_path, path, width, fmt)
+    )
@@ -0,0 +1,130 @@
+"""
+Query-driven index advisor.
+
+``advise`` requests each of ``ADVISOR_ROUTES`` through the test client, with
+the catalog cache cleared and an admin session where one is needed, and
+records the statements it runs. Every distinct SELECT is then explained:
+
+- SQLite: ``EXPLAIN QUERY PLAN``; a bare ``SCAN <table>`` reads every row.
+- PostgreSQL: ``EXPLAIN (FORMAT JSON)`` with ``enable_seqscan`` off, so a
+  ``Seq Scan`` left in the plan means no index can serve the query at all,
+  not merely that the table is small enough to scan.
+
+Placeholders in the routes are filled from rows already in the database;
+routes whose sample rows don't exist are skipped. Unfiltered listings scan
+by design, so the report is a list of leads rather than failures.
+"""
+import re
+from src.models.user import db
+from src.models.admin import Admin
+from src.models.product import Product, Order
+from src.cache import catalog_cache
+from src.query_stats import record_queries
+
+ADVISOR_ROUTES = [
+    '/api/products',
+    '/api/products?category={category}',
+    '/api/products?sort_by=price&sort_order=asc',
+    '/api/products?sort_by=name&cursor=',
+    '/api/products?search={search}',
+    '/api/products/{product_id}',
+    '/api/products/categories',
+    '/api/cart',
+    '/api/cart/count',
+    '/api/orders/{order_number}',
+    '/api/orders/email/{email}',
+    '/api/admin/orders',
+    '/api/admin/orders?status={status}',
+    '/api/admin/orders?start_date={day}&end_date={day}',
+    '/api/admin/orders/stats',
+    '/api/admin/products',
+    '/api/admin/products/search?q={search}',
+    '/api/admin/products/analytics',
+    '/api/admin/inventory/low-stock',
+]
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+def _sample_values():
+    values = {}
+    product = Product.query.filter_by(is_active=True).order_by(Product.id).first()
+    if product is not None:
+        values.update(product_id=product.id, search=product.name.split()[0])
+        if product.category:
+            values['category'] = product.category
+    order = Order.query.order_by(Order.id).first()
+    if order is not None:
+        values.update(order_number=order.order_number, email=order.customer_email, status=order.status)
+        if order.created_at:
+            values['day'] = order.created_at.date().isoformat()
+    return values
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+def explain_scans(connection, statement, parameters):
+    """Return the sequential scans in ``statement``'s plan as readable strings"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        return [row[-1] for row in rows if SQLITE_SCAN.match(row[-1])]
+    if dialect == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+        return [
+            f"Seq Scan on {node['Relation Name']}" for node in _plan_nodes(plan[0]['Plan'])
+            if node['Node Type'] == 'Seq Scan'
+        ]
+    raise ValueError(f'No index advisor for {dialect}')
+
+def advise(app, routes=ADVISOR_ROUTES):
+    """Return one ``{'route', 'status', 'queries', 'scans'}`` dict per route run.
+
+    ``scans`` is a list of ``(plan detail, statement)`` pairs. Must be called
+    inside an application context.
+    """
+    values = _sample_values()
+    client = app.test_client()
+    admin = Admin.query.filter_by(is_active=True).first()
+    if admin is not None:
+        with client.session_transaction() as session:
+            session['admin_id'] = admin.id
+
+    report = []
+    for route in routes:
+        try:
+            url = route.format(**values)
+        except KeyError:
+            report.append({'route': route, 'status': None, 'queries': 0, 'scans': []})
+            continue
+
+        catalog_cache.clear()
+        with record_queries() as recorder:
+            status = client.get(url).status_code
+
+        selects = {}
+        for statement, parameters, _ in recorder.statements:
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                selects.setdefault((statement, repr(parameters)), (statement, parameters))
+
+        scans = []
+        with db.engine.connect() as connection:
+            for statement, parameters in selects.values():
+                scans.extend((detail, statement) for detail in explain_scans(connection, statement, parameters))
+            connection.rollback()
+        report.append({'route': url, 'status': status, 'queries': len(selects), 'scans': scans})
+    return report
+
+def print_report(report):
+    flagged = 0
+    for entry in report:
+        if entry['status'] is None:
+            print(f"SKIP {entry['route']} (no sample rows)")
+            continue
+        print(f"GET {entry['route']} -> {entry['status']}, {entry['queries']} distinct SELECT(s)")
+        for detail, statement in entry['scans']:
+            print(f"    {detail}: {' '.join(statement.split())[:160]}")
+        flagged += bool(entry['scans'])
+    print(f'{flagged} route(s) with sequential scans')
@@ -1,99 +1,165 @@
 import os
 import sys
-from dotenv import load_dotenv
-
-load_dotenv()
+import tempfile
 
 # DON\'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from src.models.user import db
 from src.models.product import Product, Order, OrderItem, CartItem  # Import new models
+from flask_session import Session
 from src.routes.user import user_bp
 from src.routes.products import products_bp
 from src.routes.cart import cart_bp
 from src.routes.orders import orders_bp
 from src.routes.auth import auth_bp
 from src.routes.admin import admin_bp
-from src.routes.upload import upload_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-
-# Configuration
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
-
-# Ensure SECRET_KEY is set
-if not app.config['SECRET_KEY']:
-    raise ValueError("SECRET_KEY environment variable not set. Please set it for session security.")
-
-# Enable CORS for all routes
-CORS(app, origins=["*"] , supports_credentials=True)
-
-# Register blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(products_bp, url_prefix='/api')
-app.register_blueprint(cart_bp, url_prefix='/api')
-app.register_blueprint(orders_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api')
-app.register_blueprint(admin_bp, url_prefix='/api')
-app.register_blueprint(upload_bp, url_prefix='/api')
-
-# Database configuration
-if os.environ.get('DATABASE_URL'):
-    # Production database (PostgreSQL on Render)
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
-else:
-    # Local development database (SQLite)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-with app.app_context():
-    db.create_all()
-    
-    # Seed data only if no products exist
-    if Product.query.count() == 0:
-        from src.seed_data import seed_database
-        seed_database()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
+from src.routes.upload import upload_bp, UploadRequest
+from src.query_stats import init_query_stats
+from src.static_files import init_static_files, serve_static
+from src.compression import init_compression
+from src.db_routing import REPLICA_BIND, engine_options, init_db_routing
+from src.serialization import FastJSONProvider
+from src.cart_identity import init_cart_identity
+from src.maintenance import init_cart_gc
+
+def create_app():
+    """Build the app from environment variables.
+
+    Touches neither the database schema nor its rows, so it is cheap enough
+    for every worker, or once in a ``--preload`` master whose workers then
+    share the loaded code copy-on-write. Create and seed the database with
+    ``python src/manage.py init``.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.request_class = UploadRequest
+    # orjson-backed when installed, with cached per-product fragments
+    app.json = FastJSONProvider(app)
+
+    # Configuration
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+
+    # Ensure SECRET_KEY is set
+    if not app.config['SECRET_KEY']:
+        raise ValueError("SECRET_KEY environment variable not set. Please set it for session security.")
+
+    # Enable CORS for all routes
+    CORS(app, origins=["*"] , supports_credentials=True)
+
+    # Register blueprints
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(products_bp, url_prefix='/api')
+    app.register_blueprint(cart_bp, url_prefix='/api')
+    app.register_blueprint(orders_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
+    app.register_blueprint(upload_bp, url_prefix='/api')
+
+    # Database configuration
+    if os.environ.get('DATABASE_URL'):
+        # Production database (PostgreSQL on Render)
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
     else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+        # Local development database (SQLite)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Pool size/overflow/timeout/recycle/pre-ping from DB_POOL_* variables, for every engine
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(os.environ)
+
+    # Optional read replica for catalog and order-history GETs
+    if os.environ.get('DATABASE_READ_URL'):
+        app.config['SQLALCHEMY_BINDS'] = {
+            REPLICA_BIND: {'url': os.environ.get('DATABASE_READ_URL'), **app.config['SQLALCHEMY_ENGINE_OPTIONS']}
+        }
+    # How long a client that wrote keeps reading from the primary
+    app.config['DATABASE_READ_PIN_SECONDS'] = float(os.environ.get('DATABASE_READ_PIN_SECONDS', 5))
+    init_db_routing(app)
+
+    # Cart storage backend: sql (default), memory or redis
+    app.config['CART_STORE'] = os.environ.get('CART_STORE', 'sql')
+    app.config['CART_REDIS_URL'] = os.environ.get('CART_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['CART_TTL'] = int(os.environ.get('CART_TTL', 7 * 24 * 3600))
+    init_cart_identity(app)
+    # Seconds between in-process sweeps of SQL carts idle for CART_TTL (0 leaves it to cron)
+    app.config['CART_GC_INTERVAL'] = int(os.environ.get('CART_GC_INTERVAL', 0))
+    app.config['CART_GC_BATCH_SIZE'] = int(os.environ.get('CART_GC_BATCH_SIZE', 1000))
+    init_cart_gc(app)
+
+    # Processes rendering uploaded image renditions (0 renders inline in the request)
+    app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+    # Largest accepted product image; request bodies may add multipart overhead on top
+    app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('MAX_UPLOAD_MB', 5)) * 1024 * 1024
+    app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_BYTES'] + 64 * 1024
+    # On-disk LRU cache for resized images requested with ?w= / ?format=
+    app.config['IMAGE_CACHE_DIR'] = os.environ.get(
+        'IMAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'shopelite-image-cache')
+    )
+    app.config['IMAGE_CACHE_MAX_BYTES'] = int(os.environ.get('IMAGE_CACHE_MAX_MB', 256)) * 1024 * 1024
+
+    # Seconds product listings may show stock levels from before a checkout
+    app.config['CATALOG_STOCK_TTL'] = int(os.environ.get('CATALOG_STOCK_TTL', 60))
+
+    # Stock level at or below which admin analytics and inventory report a product as low
+    app.config['LOW_STOCK_THRESHOLD'] = int(os.environ.get('LOW_STOCK_THRESHOLD', 10))
+
+    # Per-request query counts in X-Query-* headers (on by default in development)
+    app.config['QUERY_STATS_HEADERS'] = os.environ.get(
+        'QUERY_STATS_HEADERS', str(os.environ.get('FLASK_ENV') == 'development')
+    ).lower() in ('1', 'true', 'yes')
+    app.config['QUERY_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('QUERY_N_PLUS_ONE_THRESHOLD', 3))
+    init_query_stats(app)
+
+    # Let a front proxy send file bodies: x-sendfile or x-accel-redirect (nginx)
+    app.config['SENDFILE_MODE'] = os.environ.get('SENDFILE_MODE', '')
+    app.config['SENDFILE_ACCEL_PREFIX'] = os.environ.get('SENDFILE_ACCEL_PREFIX', '/_files')
+    init_static_files(app)
+
+    # gzip/brotli for API responses of at least COMPRESS_MIN_SIZE bytes
+    app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    init_compression(app)
+    db.init_app(app)
+
+    # Session configuration
+    app.config["SESSION_PERMANENT"] = False
+    app.config["SESSION_TYPE"] = "sqlalchemy"
+    app.config["SESSION_SQLALCHEMY"] = db
+    app.config["SESSION_SQLALCHEMY_TABLE"] = "flask_sessions"
+    Session(app)
+
+    # Session cookie settings for production
+    app.config["SESSION_COOKIE_SECURE"] = True
+    app.config["SESSION_COOKIE_SAMESITE"] = "None"
+
+    # Flask-Session checks for its table on init; don't hand that connection to forked workers
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+    app.add_url_rule('/', 'serve', serve_static, defaults={'path': ''})
+    app.add_url_rule('/<path:path>', 'serve', serve_static)
+    return app
+
+def __getattr__(name):
+    # ``src.main:app`` (gunicorn, CLI scripts) loads .env and builds the app on first access
+    if name == 'app':
+        from dotenv import load_dotenv
+        load_dotenv()
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from src.manage import init_database
+    load_dotenv()
+    app = create_app()
+    # The development server is a single process, so it can prepare the database itself
+    init_database(app)
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_ENV') == 'development')
-
-
-# Session configuration
-app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "sqlalchemy"
-app.config["SESSION_SQLALCHEMY"] = db
-app.config["SESSION_SQLALCHEMY_TABLE"] = "flask_sessions"
-
-from flask_session import Session
-Session(app)
-
-
-
-
-# Session cookie settings for production
-app.config["SESSION_COOKIE_SECURE"] = True
-app.config["SESSION_COOKIE_SAMESITE"] = "None"
-
-
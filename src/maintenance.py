@@ -0,0 +1,135 @@
+"""
+Housekeeping jobs that delete expired rows.
+
+Each job deletes in batches of at most ``batch_size`` rows, one short
+transaction per batch, so it never holds row or table locks for long and
+can run next to live traffic. Run them from ``python src/manage.py``.
+
+With ``CART_GC_INTERVAL`` set, every worker also sweeps abandoned carts on
+a daemon thread (``CartSweeper``); counters for the last runs are at
+``GET /api/admin/maintenance/stats``.
+"""
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from src.models.product import CartItem
+
+def delete_in_batches(engine, table, condition, batch_size=1000, pause=0.0):
+    """Delete rows of ``table`` matching ``condition``; returns ``(rows, batches)``"""
+    key = table.primary_key.columns.values()[0]
+    total = batches = 0
+    while True:
+        with engine.begin() as connection:
+            deleted = connection.execute(
+                delete(table).where(key.in_(
+                    select(key).where(condition).order_by(key).limit(batch_size).scalar_subquery()
+                ))
+            ).rowcount
+        total += deleted
+        batches += 1
+        if deleted < batch_size:
+            return total, batches
+        if pause:
+            time.sleep(pause)
+
+def sweep_expired_sessions(app, batch_size=1000, pause=0.0):
+    """Delete server-side sessions past their expiry; returns ``(rows, batches)``"""
+    interface = app.session_interface
+    if not hasattr(interface, 'sql_session_model'):
+        return 0, 0
+    table = interface.sql_session_model.__table__
+    engine = interface.client.engine
+    return delete_in_batches(
+        engine, table, table.c.expiry.is_(None) | (table.c.expiry <= datetime.utcnow()), batch_size, pause
+    )
+
+def sweep_abandoned_carts(app, ttl=None, batch_size=1000, pause=0.0):
+    """Delete the lines of carts unchanged for ``ttl`` seconds (``CART_TTL``); returns ``(rows, batches)``
+
+    Only ``CartItem`` rows are swept; memory and Redis carts expire on their own.
+    """
+    if ttl is None:
+        ttl = app.config.get('CART_TTL', 7 * 24 * 3600)
+    table = CartItem.__table__
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    # A cart is idle only if none of its lines changed since the cutoff
+    active = select(table.c.session_id).where(table.c.updated_at >= cutoff)
+    return delete_in_batches(
+        app.extensions['sqlalchemy'].engine, table,
+        (table.c.updated_at < cutoff) & table.c.session_id.not_in(active), batch_size, pause
+    )
+
+class CartSweeper:
+    """Runs ``sweep_abandoned_carts`` about every ``interval`` seconds on a daemon thread"""
+
+    def __init__(self, app, interval, batch_size=1000):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self.runs = 0
+        self.rows = 0
+        self.last_run = None
+        self.last_rows = None
+        self.last_error = None
+
+    def start(self):
+        """Start the thread unless this process already has one"""
+        with self._lock:
+            # Forked workers inherit the master's state but not its threads
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name='cart-sweeper', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            # Jitter keeps workers that started together from sweeping in lockstep
+            time.sleep(self.interval * random.uniform(0.8, 1.2))
+            self.run_once()
+
+    def run_once(self):
+        """Sweep once, log the rows reclaimed and return ``(rows, batches)``"""
+        try:
+            with self.app.app_context():
+                rows, batches = sweep_abandoned_carts(self.app, batch_size=self.batch_size)
+        except Exception as error:
+            self.app.logger.error('Abandoned-cart sweep failed: %s', error)
+            with self._lock:
+                self.last_error = str(error)
+            return 0, 0
+        self.app.logger.info('Abandoned-cart sweep deleted %d cart item(s) in %d batch(es)', rows, batches)
+        with self._lock:
+            self.runs += 1
+            self.rows += rows
+            self.last_run = datetime.utcnow()
+            self.last_rows = rows
+            self.last_error = None
+        return rows, batches
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'runs': self.runs,
+                'rows_deleted': self.rows,
+                'last_run': self.last_run.isoformat() if self.last_run else None,
+                'last_rows_deleted': self.last_rows,
+                'last_error': self.last_error
+            }
+
+def init_cart_gc(app):
+    """Sweep abandoned carts in every worker when ``CART_GC_INTERVAL`` is set"""
+    interval = app.config.get('CART_GC_INTERVAL', 0)
+    if not interval:
+        return
+    sweeper = app.extensions['cart_gc'] = CartSweeper(app, interval, app.config.get('CART_GC_BATCH_SIZE', 1000))
+
+    # Started on the first request, so a --preload master never runs it
+    @app.before_request
+    def _start_cart_sweeper():
+        sweeper.start()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+One-shot management commands, kept out of worker startup.
+
+``init`` creates missing tables, applies migrations, builds the search
+index, the catalog version row and the order rollups, and seeds the sample
+catalog into an empty database. Run it once per deploy, before the workers
+start; it is safe to repeat.
+
+``boot-report`` measures, in fresh interpreters, how long importing
+``src.main``, building the app and answering a first request take, and
+lists the slowest imports, so regressions in worker boot time are visible.
+
+``sweep-sessions`` deletes expired ``flask_sessions`` rows and
+``sweep-carts`` the lines of carts idle for longer than ``CART_TTL``, both
+in batches (see ``src/maintenance.py``); schedule them, e.g. hourly with
+cron.
+
+Usage:
+    python src/manage.py init [--no-seed]
+    python src/manage.py boot-report [--runs 5] [--top 15]
+    python src/manage.py sweep-sessions [--batch-size 1000] [--pause 0]
+    python src/manage.py sweep-carts [--ttl SECONDS] [--batch-size 1000] [--pause 0]
+"""
+import json
+import os
+import subprocess
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+HEAVY_MODULES = ('PIL', 'redis', 'brotli')
+
+def init_database(app, seed=True):
+    """Bring the database up to date; seeds only when it has no products"""
+    from src.models.user import db
+    from src.models.product import Product
+    from src.migrations import upgrade
+    from src.search import ensure_search_index
+    from src.catalog_version import ensure_catalog_version
+    from src.order_stats import ensure_order_stats
+
+    with app.app_context():
+        db.create_all()
+        # Bring existing databases up to the current schema (new columns, indexes)
+        upgrade(db.engine)
+        ensure_search_index()
+        ensure_catalog_version()
+        ensure_order_stats()
+
+        # Seed data only if no products exist
+        if seed and db.session.query(Product.id).first() is None:
+            from src.seed_data import seed_database
+            seed_database()
+
+# Runs in a child interpreter so every measurement starts cold
+_BOOT_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+app = src.main.create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/products')
+answered = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (answered - created) * 1000,
+    'status': response.status_code,
+    'heavy_modules': sorted(name for name in %r if name in sys.modules),
+}))
+'''
+
+def _probe(importtime=False):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + \
+        ['-c', _BOOT_PROBE % (HEAVY_MODULES,)]
+    result = subprocess.run(command, cwd=root, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def _slowest_imports(importtime_log, top):
+    """Modules ``src.main`` imports directly, by cumulative time, from ``-X importtime`` output"""
+    imports = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        name = name[1:]
+        # Nested imports are indented two spaces per level; src.main's own are at level one
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) == 2:
+            imports.append((name.strip(), int(cumulative)))
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+
+def boot_report(runs=5, top=15):
+    samples = [_probe()[0] for _ in range(runs)]
+    _, importtime_log = _probe(importtime=True)
+
+    print(f'Boot time over {runs} cold start(s), median (min-max):')
+    for key, label in (('import_ms', 'import src.main'), ('create_app_ms', 'create_app()'),
+                       ('first_request_ms', 'first GET /api/products')):
+        values = sorted(sample[key] for sample in samples)
+        print(f'  {label:<24} {values[len(values) // 2]:8.1f} ms  ({values[0]:.1f}-{values[-1]:.1f})')
+    print(f"  first request status     {samples[-1]['status']}")
+    heavy = samples[-1]['heavy_modules']
+    print(f"  heavy modules loaded     {', '.join(heavy) if heavy else 'none'}")
+
+    print(f'Slowest imports (cumulative, top {top}):')
+    for module, microseconds in _slowest_imports(importtime_log, top):
+        print(f'  {module:<40} {microseconds / 1000:8.1f} ms')
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    init = subparsers.add_parser('init', help='Create, migrate and seed the database')
+    init.add_argument('--no-seed', action='store_true', help="Don't add the sample catalog")
+    report = subparsers.add_parser('boot-report', help='Measure import and boot time')
+    report.add_argument('--runs', type=int, default=5)
+    report.add_argument('--top', type=int, default=15)
+    sweep = subparsers.add_parser('sweep-sessions', help='Delete expired server-side sessions')
+    sweep.add_argument('--batch-size', type=int, default=1000)
+    sweep.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+    carts = subparsers.add_parser('sweep-carts', help='Delete abandoned SQL carts')
+    carts.add_argument('--ttl', type=int, help='Idle seconds before a cart is deleted (default: CART_TTL)')
+    carts.add_argument('--batch-size', type=int, default=1000)
+    carts.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    if args.command == 'init':
+        from src.main import create_app
+        init_database(create_app(), seed=not args.no_seed)
+        print('Database is ready')
+    elif args.command == 'sweep-sessions':
+        from src.main import create_app
+        from src.maintenance import sweep_expired_sessions
+        app = create_app()
+        with app.app_context():
+            rows, batches = sweep_expired_sessions(app, args.batch_size, args.pause)
+        print(f'Deleted {rows} expired session(s) in {batches} batch(es)')
+    elif args.command == 'sweep-carts':
+        from src.main import create_app
+        from src.maintenance import sweep_abandoned_carts
+        app = create_app()
+        with app.app_context():
+            rows, batches = sweep_abandoned_carts(app, args.ttl, args.batch_size, args.pause)
+        print(f'Deleted {rows} cart item(s) from abandoned carts in {batches} batch(es)')
+    else:
+        boot_report(args.runs, args.top)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+``db.create_all()`` creates missing tables but never changes existing ones,
+so every schema change to a table that has already shipped is a numbered
+migration here. Applied versions are recorded in ``schema_migrations``.
+``upgrade`` runs the pending ones in order, each in one transaction with its
+bookkeeping row. Migrations are idempotent, so on a database ``create_all``
+has just built from the current models they only record themselves.
+
+New migrations go at the end of ``MIGRATIONS`` and are never edited once
+released; the models are updated alongside so fresh databases match.
+
+``advise`` replays representative GET routes and reports the queries whose
+plan reads a table with a sequential scan (see ``src/index_advisor.py``).
+
+Usage:
+    python src/migrations.py upgrade
+    python src/migrations.py status
+    python src/migrations.py advise
+"""
+import os
+import sys
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
+
+migrations_table = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+def _add_product_version(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('product')}
+    if 'version' not in columns:
+        connection.execute(text('ALTER TABLE product ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+# (name, table, columns) matching the filters and sort orders of the routes
+ROUTE_INDEXES = [
+    ('ix_product_active_created', 'product', ('is_active', 'created_at', 'id')),
+    ('ix_product_active_category_created', 'product', ('is_active', 'category', 'created_at', 'id')),
+    ('ix_product_active_price', 'product', ('is_active', 'price', 'id')),
+    ('ix_product_active_name', 'product', ('is_active', 'name', 'id')),
+    ('ix_product_stock_quantity', 'product', ('stock_quantity',)),
+    ('ix_order_email_created', 'order', ('customer_email', 'created_at')),
+    ('ix_order_status_created', 'order', ('status', 'created_at')),
+    ('ix_order_created', 'order', ('created_at',)),
+    ('ix_order_item_order', 'order_item', ('order_id',)),
+    ('ix_order_item_product', 'order_item', ('product_id',)),
+    ('ix_cart_item_session_product', 'cart_item', ('session_id', 'product_id')),
+]
+
+def _create_indexes(indexes):
+    def migrate(connection):
+        quote = connection.dialect.identifier_preparer.quote
+        for name, table, columns in indexes:
+            connection.execute(text(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {quote(table)} ({", ".join(map(quote, columns))})'
+            ))
+    return migrate
+
+def _index_session_expiry(connection):
+    # The table belongs to Flask-Session and only exists with SESSION_TYPE = sqlalchemy
+    if inspect(connection).has_table('flask_sessions'):
+        _create_indexes([('ix_flask_sessions_expiry', 'flask_sessions', ('expiry',))])(connection)
+
+def _add_cart_item_updated_at(connection):
+    columns = {column['name'] for column in inspect(connection).get_columns('cart_item')}
+    if 'updated_at' not in columns:
+        connection.execute(text('ALTER TABLE cart_item ADD COLUMN updated_at TIMESTAMP'))
+        # Existing lines may have changed since they were created, and their cart cookie may
+        # have been re-issued since; start every existing cart's idle time at the upgrade
+        connection.execute(text('UPDATE cart_item SET updated_at = :now'), {'now': datetime.utcnow()})
+    _create_indexes([('ix_cart_item_updated_session', 'cart_item', ('updated_at', 'session_id'))])(connection)
+
+def _shard_order_stats(connection):
+    # The rollups are derived data: recreate them with the shard key and rebuild from ``order``
+    from src.models.product import OrderDailyStats, OrderStatusCount
+    from src.order_stats import rebuild_order_stats
+    tables = [OrderDailyStats.__table__, OrderStatusCount.__table__]
+    inspector = inspect(connection)
+    if all('shard' in {column['name'] for column in inspector.get_columns(table.name)} for table in tables):
+        return
+    for table in tables:
+        table.drop(connection)
+        table.create(connection)
+    rebuild_order_stats(connection)
+
+MIGRATIONS = [
+    (1, 'Add product.version', _add_product_version),
+    (2, 'Index route filters and sort orders', _create_indexes(ROUTE_INDEXES)),
+    (3, 'Index flask_sessions.expiry for the session sweeper', _index_session_expiry),
+    (4, 'Add cart_item.updated_at for the abandoned-cart sweeper', _add_cart_item_updated_at),
+    (5, 'Shard the order statistics rollups', _shard_order_stats),
+]
+
+def applied_versions(connection):
+    """Return ``{version: applied_at}`` for the migrations already run"""
+    connection.execute(CreateTable(migrations_table, if_not_exists=True))
+    return dict(connection.execute(select(migrations_table.c.version, migrations_table.c.applied_at)).all())
+
+def upgrade(engine):
+    """Apply pending migrations in order; returns the ``(version, name)`` pairs applied"""
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    ran = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        claimed = False
+        try:
+            with engine.begin() as connection:
+                # Claiming the version first makes a concurrent upgrade wait here, then skip it
+                connection.execute(insert(migrations_table).values(
+                    version=version, name=name, applied_at=datetime.utcnow()
+                ))
+                claimed = True
+                migrate(connection)
+        except IntegrityError:
+            if claimed:
+                raise
+            continue
+        ran.append((version, name))
+    return ran
+
+def migration_status(engine):
+    """Return ``(version, name, applied_at or None)`` for every migration"""
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+    return [(version, name, applied.get(version)) for version, name, _ in MIGRATIONS]
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['upgrade', 'status', 'advise'])
+    args = parser.parse_args(argv)
+
+    from src.main import app
+    from src.models.user import db
+    with app.app_context():
+        if args.command == 'upgrade':
+            # Migrations alter existing tables; a fresh database needs them created first
+            db.create_all()
+            ran = upgrade(db.engine)
+            for version, name in ran:
+                print(f'Applied {version:04d} {name}')
+            print(f'{len(ran)} migration(s) applied' if ran else 'Schema is up to date')
+        elif args.command == 'status':
+            for version, name, applied_at in migration_status(db.engine):
+                print(f"{version:04d} {name}: {applied_at.isoformat() if applied_at else 'pending'}")
+        else:
+            from src.index_advisor import advise, print_report
+            print_report(advise(app))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
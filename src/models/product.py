@@ -1,7 +1,19 @@
 from src.models.user import db
+from src.images import rendition_urls
+from src.serialization import product_fragment
+from sqlalchemy.orm import selectinload
 from datetime import datetime
 
 class Product(db.Model):
+    # Storefront listings filter on is_active (and category) and sort by one of these
+    __table_args__ = (
+        db.Index('ix_product_active_created', 'is_active', 'created_at', 'id'),
+        db.Index('ix_product_active_category_created', 'is_active', 'category', 'created_at', 'id'),
+        db.Index('ix_product_active_price', 'is_active', 'price', 'id'),
+        db.Index('ix_product_active_name', 'is_active', 'name', 'id'),
+        db.Index('ix_product_stock_quantity', 'stock_quantity'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -11,24 +23,40 @@ class Product(db.Model):
     stock_quantity = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped on every write (see catalog_version.py); keys the serialized fragment cache
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def __repr__(self):
         return f'<Product {self.name}>'
 
-    def to_dict(self):
+    # Only the requested fields are read, so columns left unloaded stay unloaded
+    serializers = {
+        'id': lambda p: p.id,
+        'name': lambda p: p.name,
+        'description': lambda p: p.description,
+        'price': lambda p: p.price,
+        'image_url': lambda p: p.image_url,
+        'image_renditions': lambda p: rendition_urls(p.image_url),
+        'category': lambda p: p.category,
+        'stock_quantity': lambda p: p.stock_quantity,
+        'created_at': lambda p: p.created_at.isoformat() if p.created_at else None,
+        'is_active': lambda p: p.is_active
+    }
+
+    def to_dict(self, fields=None):
         return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'price': self.price,
-            'image_url': self.image_url,
-            'category': self.category,
-            'stock_quantity': self.stock_quantity,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'is_active': self.is_active
+            name: serialize(self) for name, serialize in self.serializers.items()
+            if fields is None or name in fields
         }
 
 class Order(db.Model):
+    # Order history by customer, admin status filter, and newest-first listings
+    __table_args__ = (
+        db.Index('ix_order_email_created', 'customer_email', 'created_at'),
+        db.Index('ix_order_status_created', 'status', 'created_at'),
+        db.Index('ix_order_created', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(50), unique=True, nullable=False)
     customer_name = db.Column(db.String(200), nullable=False)
@@ -44,20 +72,35 @@ class Order(db.Model):
     def __repr__(self):
         return f'<Order {self.order_number}>'
 
-    def to_dict(self):
+    @classmethod
+    def eager_items(cls):
+        """Loader option that fetches items and their products in two queries"""
+        return selectinload(cls.items).selectinload(OrderItem.product)
+
+    serializers = {
+        'id': lambda o, _: o.id,
+        'order_number': lambda o, _: o.order_number,
+        'customer_name': lambda o, _: o.customer_name,
+        'customer_email': lambda o, _: o.customer_email,
+        'shipping_address': lambda o, _: o.shipping_address,
+        'total_amount': lambda o, _: o.total_amount,
+        'status': lambda o, _: o.status,
+        'created_at': lambda o, _: o.created_at.isoformat() if o.created_at else None,
+        'items': lambda o, product_fields: [item.to_dict(product_fields) for item in o.items]
+    }
+
+    def to_dict(self, fields=None, product_fields=None):
         return {
-            'id': self.id,
-            'order_number': self.order_number,
-            'customer_name': self.customer_name,
-            'customer_email': self.customer_email,
-            'shipping_address': self.shipping_address,
-            'total_amount': self.total_amount,
-            'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'items': [item.to_dict() for item in self.items]
+            name: serialize(self, product_fields) for name, serialize in self.serializers.items()
+            if fields is None or name in fields
         }
 
 class OrderItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_item_order', 'order_id'),
+        db.Index('ix_order_item_product', 'product_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -70,22 +113,41 @@ class OrderItem(db.Model):
     def __repr__(self):
         return f'<OrderItem {self.product_id} x {self.quantity}>'
 
-    def to_dict(self):
+    def to_dict(self, product_fields=None):
         return {
             'id': self.id,
             'order_id': self.order_id,
             'product_id': self.product_id,
             'quantity': self.quantity,
             'price': self.price,
-            'product': self.product.to_dict() if self.product else None
+            'product': product_fragment(self.product, product_fields) if self.product else None
         }
 
+class OrderIdempotencyKey(db.Model):
+    """Maps a client's Idempotency-Key to the order its checkout created"""
+    __tablename__ = 'order_idempotency_key'
+
+    key = db.Column(db.String(255), primary_key=True)
+    session_id = db.Column(db.String(100), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<OrderIdempotencyKey {self.key} -> {self.order_id}>'
+
 class CartItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_cart_item_session_product', 'session_id', 'product_id'),
+        # The abandoned-cart sweeper looks carts up by last write
+        db.Index('ix_cart_item_updated_session', 'updated_at', 'session_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), nullable=False)  # For guest users
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     product = db.relationship('Product', backref='cart_items')
@@ -100,6 +162,52 @@ class CartItem(db.Model):
             'product_id': self.product_id,
             'quantity': self.quantity,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'product': self.product.to_dict() if self.product else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'product': product_fragment(self.product) if self.product else None
         }
 
+
+class CatalogVersion(db.Model):
+    """Single-row counter bumped in the same transaction as any product write"""
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CatalogVersion {self.version}>'
+
+class StockVersion(db.Model):
+    """Sharded counter bumped by checkout stock decrements; its sum is the stock version"""
+    __tablename__ = 'stock_version'
+
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StockVersion {self.shard}: {self.version}>'
+
+class OrderDailyStats(db.Model):
+    """Order count and revenue per UTC day of ``Order.created_at``, summed over shards"""
+    __tablename__ = 'order_daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    # Spreads concurrent checkouts over several rows per day (see order_stats.py)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<OrderDailyStats {self.day}: {self.order_count}>'
+
+class OrderStatusCount(db.Model):
+    """Number of orders currently in each status, summed over shards"""
+    __tablename__ = 'order_status_count'
+
+    status = db.Column(db.String(50), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderStatusCount {self.status}: {self.order_count}>'
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained order statistics.
+
+``order_daily_stats`` holds order count and revenue per UTC day and
+``order_status_count`` the number of orders in each status. Session events
+turn every ORM insert, status/total change and delete of an ``Order`` into
+deltas that are applied, as atomic increments, in the same transaction
+just before it commits. Dashboards then read a handful of small rows
+instead of scanning ``order``.
+
+Every day and status is split over ``ORDER_STATS_SHARDS`` rows and each
+transaction adds its deltas to one shard picked at random, so concurrent
+checkouts rarely wait on each other's row locks; readers sum the shards.
+
+Anything that writes orders behind the ORM's back (bulk loads, manual SQL)
+must be followed by a rebuild:
+
+Usage:
+    python src/order_stats.py rebuild
+    python src/order_stats.py verify
+"""
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sqlalchemy import event, func, inspect, select, update, insert, delete, text
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.models.product import Order, OrderDailyStats, OrderStatusCount
+
+daily_table = OrderDailyStats.__table__
+status_table = OrderStatusCount.__table__
+
+# Whole UTC days, so "recent" may reach up to a day further back than now - 30d
+RECENT_DAYS = 30
+ORDER_STATS_SHARDS = 16
+
+def _deltas(session):
+    return session.info.setdefault('order_stat_deltas', {
+        'days': defaultdict(lambda: [0, 0.0]),
+        'statuses': defaultdict(int)
+    })
+
+def _order_day(order):
+    return (order.created_at or datetime.utcnow()).date()
+
+def _count(deltas, order, sign, status=None, total=None):
+    day = deltas['days'][_order_day(order)]
+    day[0] += sign
+    day[1] += sign * (order.total_amount if total is None else total)
+    deltas['statuses'][order.status if status is None else status] += sign
+
+@event.listens_for(Session, 'after_flush')
+def _collect_order_deltas(session, flush_context):
+    for order in session.new:
+        if isinstance(order, Order):
+            _count(_deltas(session), order, 1)
+
+    for order in session.deleted:
+        if isinstance(order, Order):
+            state = inspect(order)
+            status = state.attrs.status.history.deleted
+            total = state.attrs.total_amount.history.deleted
+            _count(_deltas(session), order, -1,
+                   status[0] if status else None, total[0] if total else None)
+
+    for order in session.dirty:
+        if not isinstance(order, Order) or order in session.deleted:
+            continue
+        state = inspect(order)
+        status = state.attrs.status.history
+        total = state.attrs.total_amount.history
+        if status.deleted and status.added and status.deleted[0] != status.added[0]:
+            deltas = _deltas(session)
+            deltas['statuses'][status.deleted[0]] -= 1
+            deltas['statuses'][status.added[0]] += 1
+        if total.deleted and total.added and total.deleted[0] != total.added[0]:
+            _deltas(session)['days'][_order_day(order)][1] += total.added[0] - total.deleted[0]
+
+def _increment(connection, table, key, values):
+    """Add ``values`` to the row for ``key`` (a column -> value dict), creating it if missing"""
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        statement = upsert(table).values({**key, **values})
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + statement.excluded[column] for column in values}
+        ))
+        return
+
+    result = connection.execute(
+        update(table).where(*(table.c[column] == value for column, value in key.items()))
+        .values({column: table.c[column] + value for column, value in values.items()})
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values({**key, **values}))
+
+@event.listens_for(Session, 'before_commit')
+def _apply_order_deltas(session):
+    session.flush()
+    deltas = session.info.pop('order_stat_deltas', None)
+    if not deltas:
+        return
+
+    # Sorted keys give concurrent commits on the same shard a consistent lock order
+    connection = session.connection()
+    shard = random.randrange(ORDER_STATS_SHARDS)
+    for day, (count, revenue) in sorted(deltas['days'].items()):
+        if count or revenue:
+            _increment(connection, daily_table, {'day': day, 'shard': shard}, {'order_count': count, 'revenue': revenue})
+    for status, count in sorted(deltas['statuses'].items()):
+        if count:
+            _increment(connection, status_table, {'status': status, 'shard': shard}, {'order_count': count})
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_order_deltas(session):
+    session.info.pop('order_stat_deltas', None)
+
+def _as_date(value):
+    # SQLite's date() returns text, PostgreSQL's a date
+    return datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else value
+
+def compute_order_stats(connection):
+    """Aggregate ``order`` from scratch; returns ``(days, statuses)`` dicts"""
+    order_table = Order.__table__
+    day = func.date(order_table.c.created_at)
+    days = {
+        _as_date(row[0]): (row[1], float(row[2] or 0))
+        for row in connection.execute(
+            select(day, func.count(), func.sum(order_table.c.total_amount)).group_by(day)
+        )
+    }
+    statuses = dict(connection.execute(
+        select(order_table.c.status, func.count()).group_by(order_table.c.status)
+    ).all())
+    return days, statuses
+
+def rebuild_order_stats(connection):
+    """Replace the rollups with a fresh aggregate of ``order``"""
+    if connection.dialect.name == 'postgresql':
+        # Block order writes so none land between the aggregate and the insert
+        connection.execute(text('LOCK TABLE "order" IN SHARE MODE'))
+    # Deleting first also takes SQLite's write lock before aggregating
+    connection.execute(delete(daily_table))
+    connection.execute(delete(status_table))
+
+    days, statuses = compute_order_stats(connection)
+    if days:
+        connection.execute(insert(daily_table), [
+            {'day': day, 'shard': 0, 'order_count': count, 'revenue': revenue}
+            for day, (count, revenue) in days.items()
+        ])
+    if statuses:
+        connection.execute(insert(status_table), [
+            {'status': status, 'shard': 0, 'order_count': count} for status, count in statuses.items()
+        ])
+    return days, statuses
+
+def verify_order_stats(connection, tolerance=0.005):
+    """Return a list of human-readable differences between rollups and ``order``"""
+    days, statuses = compute_order_stats(connection)
+    stored_days = {
+        _as_date(day): (count, revenue)
+        for day, count, revenue in connection.execute(
+            select(daily_table.c.day, func.sum(daily_table.c.order_count), func.sum(daily_table.c.revenue))
+            .group_by(daily_table.c.day)
+        ) if count or abs(revenue) > tolerance
+    }
+    stored_statuses = {
+        status: count for status, count in connection.execute(
+            select(status_table.c.status, func.sum(status_table.c.order_count)).group_by(status_table.c.status)
+        ) if count
+    }
+
+    problems = []
+    for day in sorted(set(days) | set(stored_days)):
+        expected, stored = days.get(day, (0, 0.0)), stored_days.get(day, (0, 0.0))
+        if expected[0] != stored[0] or abs(expected[1] - stored[1]) > tolerance:
+            problems.append(f'{day}: expected {expected[0]} orders / {expected[1]:.2f}, '
+                            f'rollup has {stored[0]} / {stored[1]:.2f}')
+    for status in sorted(set(statuses) | set(stored_statuses)):
+        if statuses.get(status, 0) != stored_statuses.get(status, 0):
+            problems.append(f'status {status}: expected {statuses.get(status, 0)}, '
+                            f'rollup has {stored_statuses.get(status, 0)}')
+    return problems
+
+def ensure_order_stats():
+    """Build the rollups for a database that has orders but no rollups yet"""
+    if db.session.query(OrderStatusCount.status).first() is None and \
+            db.session.query(Order.id).first() is not None:
+        rebuild_order_stats(db.session.connection())
+        db.session.commit()
+
+def order_stats():
+    """Dashboard totals read from the rollup tables"""
+    total_orders, total_revenue = db.session.query(
+        func.coalesce(func.sum(OrderDailyStats.order_count), 0),
+        func.coalesce(func.sum(OrderDailyStats.revenue), 0.0)
+    ).one()
+
+    since = (datetime.utcnow() - timedelta(days=RECENT_DAYS)).date()
+    recent_orders = db.session.query(
+        func.coalesce(func.sum(OrderDailyStats.order_count), 0)
+    ).filter(OrderDailyStats.day >= since).scalar()
+
+    status_breakdown = {
+        status: int(count) for status, count in db.session.query(
+            OrderStatusCount.status, func.sum(OrderStatusCount.order_count)
+        ).group_by(OrderStatusCount.status).having(func.sum(OrderStatusCount.order_count) > 0)
+    }
+
+    return {
+        'total_orders': int(total_orders),
+        'total_revenue': round(float(total_revenue), 2),
+        'status_breakdown': status_breakdown,
+        'recent_orders_30_days': int(recent_orders)
+    }
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['rebuild', 'verify'])
+    args = parser.parse_args(argv)
+
+    from src.main import app
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if args.command == 'rebuild':
+                days, statuses = rebuild_order_stats(connection)
+                print(f'Rebuilt {len(days)} daily rows and {len(statuses)} status rows')
+                return 0
+            problems = verify_order_stats(connection)
+        for problem in problems:
+            print(problem)
+        print(f'{len(problems)} difference(s)' if problems else 'Rollups match the order table')
+        return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Keyset (cursor) pagination for listing endpoints.
+
+Instead of ``OFFSET n`` the next page is selected with a ``WHERE`` on the
+last row's sort key plus its id, so every page costs the same no matter how
+deep it is. The position is handed to clients as an opaque ``next_cursor``.
+"""
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+from src.models.user import db
+
+COUNT_MODES = ('none', 'estimate', 'exact')
+ESTIMATE_COUNT_CAP = 1000
+
+def encode_cursor(sort_column, row):
+    """Build an opaque cursor pointing just past ``row``"""
+    value = getattr(row, sort_column.key)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = {'k': sort_column.key, 'v': value, 'id': row.id}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(sort_column, cursor):
+    """Return the ``(value, id)`` position stored in ``cursor``.
+
+    Raises ``ValueError`` if the cursor is malformed or was issued for a
+    different sort order.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key, value, row_id = payload['k'], payload['v'], int(payload['id'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+
+    if key != sort_column.key:
+        raise ValueError('Cursor does not match the requested sort order')
+
+    if value is not None and sort_column.type.python_type is datetime:
+        value = datetime.fromisoformat(value)
+    return value, row_id
+
+def estimate_count(query):
+    """Return ``(count, is_estimate)`` without paying for an exact count.
+
+    PostgreSQL reports the planner's row estimate. Other backends count at
+    most ``ESTIMATE_COUNT_CAP`` rows, which is exact below the cap.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        compiled = query.order_by(None).statement.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().exec_driver_sql(
+            f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), True
+
+    count = query.order_by(None).limit(ESTIMATE_COUNT_CAP).count()
+    return count, count >= ESTIMATE_COUNT_CAP
+
+class KeysetPage:
+    """One page of a keyset-paginated query"""
+
+    def __init__(self, items, next_cursor, total=None, total_estimated=False):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+        self.total_estimated = total_estimated
+
+    def to_dict(self):
+        data = {
+            'next_cursor': self.next_cursor,
+            'has_more': self.next_cursor is not None
+        }
+        if self.total is not None:
+            data['total'] = self.total
+            data['total_estimated'] = self.total_estimated
+        return data
+
+def keyset_paginate(query, sort_column, descending=True, per_page=20, cursor=None, count='none'):
+    """Fetch one page of ``query`` ordered by ``sort_column`` then id.
+
+    ``cursor`` is the ``next_cursor`` of the previous page (empty or None for
+    the first page). ``count`` is one of ``COUNT_MODES`` and decides whether
+    the total is skipped, estimated or counted exactly.
+    """
+    if count not in COUNT_MODES:
+        raise ValueError(f"count must be one of: {', '.join(COUNT_MODES)}")
+
+    per_page = max(per_page, 1)
+    id_column = sort_column.class_.id
+    total, total_estimated = None, False
+    if count == 'exact':
+        total = query.order_by(None).count()
+    elif count == 'estimate':
+        total, total_estimated = estimate_count(query)
+
+    if cursor:
+        value, row_id = decode_cursor(sort_column, cursor)
+        if sort_column.key == id_column.key:
+            query = query.filter(id_column < row_id if descending else id_column > row_id)
+        elif descending:
+            query = query.filter(or_(
+                sort_column < value,
+                and_(sort_column == value, id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_column > value,
+                and_(sort_column == value, id_column > row_id)
+            ))
+
+    if sort_column.key == id_column.key:
+        order = [id_column.desc() if descending else id_column.asc()]
+    elif descending:
+        order = [sort_column.desc(), id_column.desc()]
+    else:
+        order = [sort_column.asc(), id_column.asc()]
+
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+    next_cursor = encode_cursor(sort_column, rows[per_page - 1]) if len(rows) > per_page else None
+
+    return KeysetPage(rows[:per_page], next_cursor, total, total_estimated)
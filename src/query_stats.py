@@ -0,0 +1,156 @@
+"""
+Per-request SQL statement counting and N+1 detection.
+
+Every statement executed on any engine is reported to the recorders that
+are active on the current thread. ``init_query_stats`` opens one recorder
+per request and, when ``QUERY_STATS_HEADERS`` is on, reports it in
+``X-Query-*`` response headers. ``query_budget`` opens one around a block
+of test code and fails if the block runs more statements than declared.
+
+A statement that runs at least ``QUERY_N_PLUS_ONE_THRESHOLD`` times with
+different parameters is flagged as a probable N+1, e.g. a lazy load per
+row of a listing.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import g, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 3
+
+_local = threading.local()
+
+def _active_recorders():
+    if not hasattr(_local, 'recorders'):
+        _local.recorders = []
+    return _local.recorders
+
+class QueryRecorder:
+    """Collects the statements executed while it is active"""
+
+    def __init__(self, n_plus_one_threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.statements = []
+
+    def record(self, statement, parameters, duration):
+        self.statements.append((statement, parameters, duration))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, _, duration in self.statements)
+
+    def repeated_statements(self):
+        """Return ``(statement, executions)`` for probable N+1 patterns, worst first"""
+        executions = defaultdict(int)
+        distinct_params = defaultdict(set)
+        for statement, parameters, _ in self.statements:
+            executions[statement] += 1
+            distinct_params[statement].add(repr(parameters))
+
+        repeated = [
+            (statement, count) for statement, count in executions.items()
+            if count >= self.n_plus_one_threshold and len(distinct_params[statement]) > 1
+        ]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+    def report(self):
+        """Human-readable list of executed statements, for assertion messages"""
+        lines = [f'{self.count} statements in {self.total_time * 1000:.1f}ms']
+        for statement, count in self.repeated_statements():
+            lines.append(f'  probable N+1 ({count}x): {_one_line(statement)}')
+        for index, (statement, _, duration) in enumerate(self.statements, 1):
+            lines.append(f'  {index}. [{duration * 1000:.2f}ms] {_one_line(statement)}')
+        return '\n'.join(lines)
+
+def _one_line(statement, limit=200):
+    text = ' '.join(statement.split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_recorders():
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorders = _active_recorders()
+    if not recorders:
+        return
+    start_times = conn.info.get('query_start_time')
+    duration = time.perf_counter() - start_times.pop() if start_times else 0.0
+    for recorder in recorders:
+        recorder.record(statement, parameters, duration)
+
+@contextmanager
+def record_queries(n_plus_one_threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+    """Collect the statements the enclosed block executes in a ``QueryRecorder``"""
+    recorder = QueryRecorder(n_plus_one_threshold)
+    recorders = _active_recorders()
+    recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        recorders.remove(recorder)
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by ``query_budget`` when a block runs too many statements"""
+
+@contextmanager
+def query_budget(max_queries, n_plus_one_threshold=DEFAULT_N_PLUS_ONE_THRESHOLD, allow_n_plus_one=False):
+    """Fail if the enclosed block executes more than ``max_queries`` statements.
+
+    Also fails on probable N+1 patterns unless ``allow_n_plus_one`` is set::
+
+        with query_budget(5):
+            client.get('/api/admin/orders')
+    """
+    with record_queries(n_plus_one_threshold) as recorder:
+        yield recorder
+
+    if recorder.count > max_queries:
+        raise QueryBudgetExceeded(f'Query budget of {max_queries} exceeded: {recorder.report()}')
+    if not allow_n_plus_one and recorder.repeated_statements():
+        raise QueryBudgetExceeded(f'Probable N+1 detected: {recorder.report()}')
+
+def init_query_stats(app):
+    """Record statements per request and report them in debug headers.
+
+    Does nothing unless ``QUERY_STATS_HEADERS`` is enabled, so production
+    requests pay no bookkeeping cost.
+    """
+    if not app.config.get('QUERY_STATS_HEADERS'):
+        return
+
+    @app.before_request
+    def _start_query_recorder():
+        g.query_recorder = QueryRecorder(
+            app.config.get('QUERY_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+        )
+        _active_recorders().append(g.query_recorder)
+
+    @app.after_request
+    def _add_query_headers(response):
+        recorder = g.get('query_recorder')
+        if recorder is None:
+            return response
+        response.headers['X-Query-Count'] = str(recorder.count)
+        response.headers['X-Query-Time-Ms'] = f'{recorder.total_time * 1000:.2f}'
+        repeated = recorder.repeated_statements()
+        if repeated:
+            statement, count = repeated[0]
+            response.headers['X-Query-N-Plus-One'] = f'{count}x {_one_line(statement)}'
+            current_app.logger.warning('Probable N+1 on %s: %s', request.path, recorder.report())
+        return response
+
+    @app.teardown_request
+    def _stop_query_recorder(exc):
+        recorder = g.pop('query_recorder', None)
+        if recorder is not None and recorder in _active_recorders():
+            _active_recorders().remove(recorder)
@@ -1,12 +1,29 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from src.models.user import db
 from src.models.product import Product, Order, OrderItem
-from src.routes.auth import admin_required
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from src.routes.auth import admin_required, admin_cache
+from src.routes.orders import apply_order_filters
+from src.search import apply_search
+from src.pagination import keyset_paginate
+from src.cache import catalog_cache, fragment_cache, invalidate_catalog
+from src.order_stats import order_stats
+from src.images import get_derivative_cache
+from src.compression import compression_stats
+from src.db_routing import pool_stats
+from src.fields import request_product_fields, product_columns
+from src.serialization import product_fragment
+from src.catalog_version import current_catalog_version, current_stock_version
+from sqlalchemy import func, case
+from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__)
 
+# Default fieldsets of the admin lists when no fields= is given
+ADMIN_SEARCH_FIELDS = frozenset({
+    'id', 'name', 'description', 'price', 'category', 'stock_quantity', 'image_url', 'created_at'
+})
+LOW_STOCK_FIELDS = frozenset({'id', 'name', 'stock_quantity', 'category', 'price'})
+
 @admin_bp.route('/admin/products', methods=['GET'])
 @admin_required
 def get_admin_products():
@@ -47,6 +64,7 @@ def create_admin_product():
         
         db.session.add(product)
         db.session.commit()
+        invalidate_catalog([product.id])
         
         return jsonify({
             'message': 'Product created successfully',
@@ -80,6 +98,7 @@ def update_admin_product(product_id):
         product.image_url = data.get('image_url', product.image_url)
         
         db.session.commit()
+        invalidate_catalog([product_id])
         
         return jsonify({
             'message': 'Product updated successfully',
@@ -105,6 +124,7 @@ def delete_admin_product(product_id):
         product = Product.query.get_or_404(product_id)
         db.session.delete(product)
         db.session.commit()
+        invalidate_catalog([product_id])
         
         return jsonify({'message': 'Product deleted successfully'})
     except Exception as e:
@@ -114,9 +134,20 @@ def delete_admin_product(product_id):
 @admin_bp.route('/admin/orders', methods=['GET'])
 @admin_required
 def get_admin_orders():
-    """Get all orders for admin"""
+    """Get orders for admin, paginated and filterable by status and date range"""
     try:
-        orders = Order.query.order_by(Order.created_at.desc()).all()
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 20, type=int)
+        
+        try:
+            query = apply_order_filters(Order.query.options(Order.eager_items()), request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format, use YYYY-MM-DD'}), 400
+        
+        orders = query.order_by(Order.created_at.desc()).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        
         return jsonify({
             'orders': [{
                 'id': o.id,
@@ -137,7 +168,11 @@ def get_admin_orders():
                     'quantity': item.quantity,
                     'price': float(item.price)
                 } for item in o.items]
-            } for o in orders]
+            } for o in orders.items],
+            'total': orders.total,
+            'pages': orders.pages,
+            'current_page': page,
+            'per_page': per_page
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -147,20 +182,11 @@ def get_admin_orders():
 def get_order_stats():
     """Get order statistics for admin dashboard"""
     try:
-        # Total revenue
-        total_revenue = db.session.query(func.sum(Order.total_amount)).scalar() or 0
-        
-        # Total orders
-        total_orders = Order.query.count()
-        
-        # Recent orders (last 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_orders_30_days = Order.query.filter(Order.created_at >= thirty_days_ago).count()
-        
+        stats = order_stats()
         return jsonify({
-            'total_revenue': float(total_revenue),
-            'total_orders': total_orders,
-            'recent_orders_30_days': recent_orders_30_days
+            'total_revenue': stats['total_revenue'],
+            'total_orders': stats['total_orders'],
+            'recent_orders_30_days': stats['recent_orders_30_days']
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -198,33 +224,44 @@ def search_admin_products():
         category = request.args.get('category', '')
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
+        try:
+            fields = request_product_fields(request.args) or ADMIN_SEARCH_FIELDS
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        products_query = Product.query
+        cursor_mode = 'cursor' in request.args
+        products_query = Product.query.options(product_columns(fields))
         
         if query:
-            products_query = products_query.filter(
-                Product.name.contains(query) | 
-                Product.description.contains(query)
-            )
+            products_query = apply_search(products_query, query, order_by_rank=not cursor_mode)
         
         if category:
             products_query = products_query.filter(Product.category == category)
         
+        if cursor_mode:
+            try:
+                result = keyset_paginate(
+                    products_query, Product.id, False, per_page,
+                    cursor=request.args.get('cursor'),
+                    count=request.args.get('count', 'none')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'products': [product_fragment(p, fields) for p in result.items],
+                'pagination': {
+                    'per_page': per_page,
+                    **result.to_dict()
+                }
+            })
+        
         products = products_query.paginate(
             page=page, per_page=per_page, error_out=False
         )
         
         return jsonify({
-            'products': [{
-                'id': p.id,
-                'name': p.name,
-                'description': p.description,
-                'price': float(p.price),
-                'category': p.category,
-                'stock_quantity': p.stock_quantity,
-                'image_url': p.image_url,
-                'created_at': p.created_at.isoformat() if p.created_at else None
-            } for p in products.items],
+            'products': [product_fragment(p, fields) for p in products.items],
             'pagination': {
                 'page': products.page,
                 'pages': products.pages,
@@ -269,6 +306,7 @@ def bulk_update_products():
                     setattr(product, field, value)
         
         db.session.commit()
+        invalidate_catalog(product_ids)
         
         return jsonify({
             'message': f'Updated {len(products)} products successfully'
@@ -290,6 +328,7 @@ def bulk_delete_products():
         
         deleted_count = Product.query.filter(Product.id.in_(product_ids)).delete()
         db.session.commit()
+        invalidate_catalog(product_ids)
         
         return jsonify({
             'message': f'Deleted {deleted_count} products successfully'
@@ -298,45 +337,48 @@ def bulk_delete_products():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def is_low_stock(threshold):
+    """Filter for products at or below ``threshold`` units, including out of stock"""
+    return Product.stock_quantity <= threshold
+
+def product_analytics(threshold):
+    """Dashboard figures from a single grouped pass over ``product``"""
+    rows = db.session.query(
+        Product.category,
+        func.count(Product.id),
+        func.avg(Product.price),
+        func.sum(case((is_low_stock(threshold), 1), else_=0)),
+        func.sum(case((Product.stock_quantity == 0, 1), else_=0))
+    ).group_by(Product.category).all()
+    
+    return {
+        'low_stock_threshold': threshold,
+        'total_products': sum(row[1] for row in rows),
+        'low_stock_products': int(sum(row[3] or 0 for row in rows)),
+        'out_of_stock_products': int(sum(row[4] or 0 for row in rows)),
+        'category_distribution': [
+            {'category': category, 'count': count}
+            for category, count, _, _, _ in rows
+        ],
+        'price_by_category': [
+            {'category': category, 'avg_price': float(avg_price)}
+            for category, _, avg_price, _, _ in rows
+        ]
+    }
+
 @admin_bp.route('/admin/products/analytics', methods=['GET'])
 @admin_required
 def get_product_analytics():
     """Get product analytics"""
     try:
-        # Total products
-        total_products = Product.query.count()
-        
-        # Low stock products (less than 10)
-        low_stock_products = Product.query.filter(Product.stock_quantity < 10).count()
-        
-        # Out of stock products
-        out_of_stock_products = Product.query.filter(Product.stock_quantity == 0).count()
-        
-        # Products by category
-        category_stats = db.session.query(
-            Product.category,
-            func.count(Product.id).label('count')
-        ).group_by(Product.category).all()
-        
-        # Average price by category
-        price_stats = db.session.query(
-            Product.category,
-            func.avg(Product.price).label('avg_price')
-        ).group_by(Product.category).all()
-        
-        return jsonify({
-            'total_products': total_products,
-            'low_stock_products': low_stock_products,
-            'out_of_stock_products': out_of_stock_products,
-            'category_distribution': [
-                {'category': cat, 'count': count} 
-                for cat, count in category_stats
-            ],
-            'price_by_category': [
-                {'category': cat, 'avg_price': float(avg_price)} 
-                for cat, avg_price in price_stats
-            ]
-        })
+        threshold = int(request.args.get('threshold', current_app.config['LOW_STOCK_THRESHOLD']))
+        # Keyed on the shared versions, as other workers' writes don't clear this worker's cache
+        cache_key = ('analytics', threshold, current_catalog_version()[0], current_stock_version())
+        payload = catalog_cache.get(cache_key)
+        if payload is None:
+            payload = product_analytics(threshold)
+            catalog_cache.set(cache_key, payload)
+        return jsonify(payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -345,17 +387,16 @@ def get_product_analytics():
 def get_low_stock_products():
     """Get products with low stock"""
     try:
-        threshold = int(request.args.get('threshold', 10))
-        products = Product.query.filter(Product.stock_quantity <= threshold).all()
+        threshold = int(request.args.get('threshold', current_app.config['LOW_STOCK_THRESHOLD']))
+        try:
+            fields = request_product_fields(request.args) or LOW_STOCK_FIELDS
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        products = Product.query.options(product_columns(fields)).filter(is_low_stock(threshold)).all()
         
         return jsonify({
-            'products': [{
-                'id': p.id,
-                'name': p.name,
-                'stock_quantity': p.stock_quantity,
-                'category': p.category,
-                'price': float(p.price)
-            } for p in products]
+            'products': [product_fragment(p, fields) for p in products]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -375,6 +416,7 @@ def update_product_stock():
         product = Product.query.get_or_404(product_id)
         product.stock_quantity = new_stock
         db.session.commit()
+        invalidate_catalog([product.id])
         
         return jsonify({
             'message': 'Stock updated successfully',
@@ -388,3 +430,45 @@ def update_product_stock():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+
+@admin_bp.route('/admin/cache/stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """Get catalog, product fragment, admin and resized-image cache counters"""
+    try:
+        return jsonify({
+            'catalog': catalog_cache.stats(),
+            'fragments': fragment_cache.stats(),
+            'admin': admin_cache.stats(),
+            'images': get_derivative_cache().stats()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/admin/compression/stats', methods=['GET'])
+@admin_required
+def get_compression_stats():
+    """Get response compression counters and overall ratio"""
+    try:
+        return jsonify(compression_stats(current_app))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/admin/db/pool', methods=['GET'])
+@admin_required
+def get_pool_stats():
+    """Get connection pool occupancy and read-replica routing counters"""
+    try:
+        return jsonify(pool_stats(current_app))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/admin/maintenance/stats', methods=['GET'])
+@admin_required
+def get_maintenance_stats():
+    """Get this worker's abandoned-cart sweeper counters (null when CART_GC_INTERVAL is 0)"""
+    try:
+        sweeper = current_app.extensions.get('cart_gc')
+        return jsonify({'cart_gc': sweeper.to_dict() if sweeper else None})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,11 +1,29 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import db
 from src.models.admin import Admin
+from src.cache import TTLCache
 from datetime import datetime
 from functools import wraps
+import os
 
 auth_bp = Blueprint('auth', __name__)
 
+# Per-worker cache of authenticated admins. The TTL bounds how long a
+# deactivated admin keeps access on workers that already cached them.
+admin_cache = TTLCache(
+    maxsize=256,
+    ttl=float(os.environ.get('ADMIN_CACHE_TTL', 30))
+)
+
+def get_active_admin(admin_id):
+    """Return the admin's dict if the admin exists and is active, else None"""
+    admin_data = admin_cache.get(admin_id)
+    if admin_data is None:
+        admin = db.session.get(Admin, admin_id)
+        admin_data = admin.to_dict() if admin else {'id': admin_id, 'is_active': False}
+        admin_cache.set(admin_id, admin_data)
+    return admin_data if admin_data['is_active'] else None
+
 def admin_required(f):
     """Decorator to require admin authentication"""
     @wraps(f)
@@ -13,8 +31,7 @@ def admin_required(f):
         if 'admin_id' not in session:
             return jsonify({'error': 'Authentication required'}), 401
         
-        admin = Admin.query.get(session['admin_id'])
-        if not admin or not admin.is_active:
+        if not get_active_admin(session['admin_id']):
             session.pop('admin_id', None)
             return jsonify({'error': 'Invalid or inactive admin'}), 401
         
@@ -37,6 +54,7 @@ def admin_login():
         if admin and admin.check_password(password) and admin.is_active:
             session['admin_id'] = admin.id
             admin.update_last_login()
+            admin_cache.set(admin.id, admin.to_dict())
             
             return jsonify({
                 'message': 'Login successful',
@@ -65,14 +83,14 @@ def check_admin_auth():
         if 'admin_id' not in session:
             return jsonify({'authenticated': False}), 200
         
-        admin = Admin.query.get(session['admin_id'])
-        if not admin or not admin.is_active:
+        admin_data = get_active_admin(session['admin_id'])
+        if not admin_data:
             session.pop('admin_id', None)
             return jsonify({'authenticated': False}), 200
         
         return jsonify({
             'authenticated': True,
-            'admin': admin.to_dict()
+            'admin': admin_data
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,30 +1,41 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from src.models.user import db
-from src.models.product import Product, CartItem
-import uuid
+from src.models.product import Product
+from src.cart_store import get_cart_store
+from src.serialization import product_fragment
+from src.cart_identity import current_cart_id, ensure_cart_id
 
 cart_bp = Blueprint('cart', __name__)
 
-def get_session_id():
-    """Get or create a session ID for cart management"""
-    if 'cart_session_id' not in session:
-        session['cart_session_id'] = str(uuid.uuid4())
-    return session['cart_session_id']
-
 @cart_bp.route('/cart', methods=['GET'])
 def get_cart():
     """Get all items in the current cart"""
     try:
-        session_id = get_session_id()
-        cart_items = CartItem.query.filter_by(session_id=session_id).all()
+        session_id = current_cart_id()
+        lines = get_cart_store().lines(session_id) if session_id else []
+        
+        # Load every product in the cart with one query
+        product_ids = [line['product_id'] for line in lines]
+        products = {
+            product.id: product
+            for product in Product.query.filter(Product.id.in_(product_ids)).all()
+        } if product_ids else {}
         
         total = 0
         items_data = []
         
-        for item in cart_items:
-            item_data = item.to_dict()
-            if item.product:
-                subtotal = item.product.price * item.quantity
+        for line in lines:
+            product = products.get(line['product_id'])
+            item_data = {
+                'id': line['id'],
+                'session_id': session_id,
+                'product_id': line['product_id'],
+                'quantity': line['quantity'],
+                'created_at': line['created_at'].isoformat() if line['created_at'] else None,
+                'product': product_fragment(product) if product else None
+            }
+            if product:
+                subtotal = product.price * line['quantity']
                 item_data['subtotal'] = subtotal
                 total += subtotal
             items_data.append(item_data)
@@ -32,7 +43,7 @@ def get_cart():
         return jsonify({
             'items': items_data,
             'total': total,
-            'item_count': len(cart_items)
+            'item_count': len(lines)
         })
     
     except Exception as e:
@@ -54,7 +65,7 @@ def add_to_cart():
             return jsonify({'error': 'Quantity must be greater than 0'}), 400
         
         # Check if product exists and is active
-        product = Product.query.get(product_id)
+        product = db.session.get(Product, product_id)
         if not product or not product.is_active:
             return jsonify({'error': 'Product not found'}), 404
         
@@ -62,30 +73,18 @@ def add_to_cart():
         if product.stock_quantity < quantity:
             return jsonify({'error': 'Insufficient stock'}), 400
         
-        session_id = get_session_id()
+        session_id = ensure_cart_id()
+        store = get_cart_store()
         
-        # Check if item already exists in cart
-        existing_item = CartItem.query.filter_by(
-            session_id=session_id,
-            product_id=product_id
-        ).first()
+        # Check the quantity already in the cart
+        existing_line = next(
+            (line for line in store.lines(session_id) if line['product_id'] == product_id),
+            None
+        )
+        if existing_line and product.stock_quantity < existing_line['quantity'] + quantity:
+            return jsonify({'error': 'Insufficient stock'}), 400
         
-        if existing_item:
-            # Update quantity
-            new_quantity = existing_item.quantity + quantity
-            if product.stock_quantity < new_quantity:
-                return jsonify({'error': 'Insufficient stock'}), 400
-            existing_item.quantity = new_quantity
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                session_id=session_id,
-                product_id=product_id,
-                quantity=quantity
-            )
-            db.session.add(cart_item)
-        
-        db.session.commit()
+        store.add(session_id, product_id, quantity, product.price)
         return jsonify({'message': 'Item added to cart successfully'})
     
     except Exception as e:
@@ -102,26 +101,26 @@ def update_cart_item(item_id):
             return jsonify({'error': 'Quantity is required'}), 400
         
         quantity = int(data['quantity'])
-        session_id = get_session_id()
+        session_id = current_cart_id()
+        store = get_cart_store()
         
-        cart_item = CartItem.query.filter_by(
-            id=item_id,
-            session_id=session_id
-        ).first()
+        line = store.get_line(session_id, item_id) if session_id else None
         
-        if not cart_item:
+        if not line:
             return jsonify({'error': 'Cart item not found'}), 404
         
         if quantity <= 0:
-            # Remove item if quantity is 0 or negative
-            db.session.delete(cart_item)
+            # Remove item if quantity is 0 or negative; the store keeps the remaining lines fresh
+            store.remove(session_id, item_id)
         else:
             # Check stock availability
-            if cart_item.product.stock_quantity < quantity:
+            product = db.session.get(Product, line['product_id'])
+            if not product or product.stock_quantity < quantity:
                 return jsonify({'error': 'Insufficient stock'}), 400
-            cart_item.quantity = quantity
+            store.set_quantity(session_id, item_id, quantity, product.price)
+        # Re-issues the cookie, keeping an active cart alive for another CART_TTL
+        ensure_cart_id()
         
-        db.session.commit()
         return jsonify({'message': 'Cart updated successfully'})
     
     except Exception as e:
@@ -132,18 +131,11 @@ def update_cart_item(item_id):
 def remove_from_cart(item_id):
     """Remove an item from the cart"""
     try:
-        session_id = get_session_id()
-        
-        cart_item = CartItem.query.filter_by(
-            id=item_id,
-            session_id=session_id
-        ).first()
+        session_id = current_cart_id()
         
-        if not cart_item:
+        if not session_id or not get_cart_store().remove(session_id, item_id):
             return jsonify({'error': 'Cart item not found'}), 404
-        
-        db.session.delete(cart_item)
-        db.session.commit()
+        ensure_cart_id()
         
         return jsonify({'message': 'Item removed from cart successfully'})
     
@@ -155,10 +147,10 @@ def remove_from_cart(item_id):
 def clear_cart():
     """Clear all items from the cart"""
     try:
-        session_id = get_session_id()
+        session_id = current_cart_id()
         
-        CartItem.query.filter_by(session_id=session_id).delete()
-        db.session.commit()
+        if session_id:
+            get_cart_store().clear(session_id)
         
         return jsonify({'message': 'Cart cleared successfully'})
     
@@ -168,12 +160,13 @@ def clear_cart():
 
 @cart_bp.route('/cart/count', methods=['GET'])
 def get_cart_count():
-    """Get the number of items in the cart"""
+    """Get the number of items in the cart, plus its quantity and total"""
     try:
-        session_id = get_session_id()
-        count = CartItem.query.filter_by(session_id=session_id).count()
-        return jsonify({'count': count})
+        session_id = current_cart_id()
+        if not session_id:
+            # No cart yet; answered without creating one
+            return jsonify({'count': 0, 'quantity': 0, 'total': 0.0})
+        return jsonify(get_cart_store().summary(session_id))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
@@ -1,14 +1,43 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify
 from src.models.user import db
-from src.models.product import Product, CartItem, Order, OrderItem
+from src.models.product import Product, Order, OrderItem, OrderIdempotencyKey
+from src.pagination import keyset_paginate
+from src.cart_store import get_cart_store
+from src.cart_identity import current_cart_id
+from src.order_stats import order_stats
+from src.fields import request_order_fields, order_load_options
+from src.db_routing import read_replica
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 orders_bp = Blueprint('orders', __name__)
 
-def get_session_id():
-    """Get session ID for cart management"""
-    return session.get('cart_session_id')
+def apply_order_filters(query, args):
+    """Filter an Order query by status and an inclusive created_at date range.
+    
+    Raises ValueError if start_date or end_date is not an ISO date/datetime.
+    """
+    status = args.get('status')
+    start_date = args.get('start_date')
+    end_date = args.get('end_date')
+    
+    if status:
+        query = query.filter(Order.status == status)
+    
+    if start_date:
+        query = query.filter(Order.created_at >= datetime.fromisoformat(start_date))
+    
+    if end_date:
+        end = datetime.fromisoformat(end_date)
+        if len(end_date) == 10:
+            # A bare date includes the whole day
+            query = query.filter(Order.created_at < end + timedelta(days=1))
+        else:
+            query = query.filter(Order.created_at <= end)
+    
+    return query
 
 def generate_order_number():
     """Generate a unique order number"""
@@ -16,9 +45,50 @@ def generate_order_number():
     random_suffix = str(uuid.uuid4())[:8].upper()
     return f"ORD-{timestamp}-{random_suffix}"
 
+def order_created_response(order_id, replayed=False):
+    """Build the checkout response for an order, loading its items eagerly"""
+    order = Order.query.options(Order.eager_items()).filter_by(id=order_id).one()
+    response = jsonify({
+        'message': 'Order placed successfully',
+        'order': order.to_dict()
+    })
+    response.status_code = 201
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def replay_idempotent_checkout(key, session_id):
+    """Return the response for an already-used Idempotency-Key, or None if unused"""
+    record = db.session.get(OrderIdempotencyKey, key)
+    if not record:
+        return None
+    if record.session_id != session_id:
+        return jsonify({'error': 'Idempotency-Key was already used for a different cart'}), 409
+    return order_created_response(record.order_id, replayed=True)
+
+def idempotent_checkout_conflict(key, session_id):
+    """Answer a retry that lost the race for its cart to a request with the same key.
+
+    Returns the original order once that request has committed, otherwise a
+    409 asking the client to retry later.
+    """
+    # A fresh transaction sees a key committed since this request started
+    db.session.rollback()
+    replay = replay_idempotent_checkout(key, session_id)
+    if replay is not None:
+        return replay
+    return jsonify({'error': 'A request with this Idempotency-Key is in progress, please retry'}), 409
+
 @orders_bp.route('/orders/checkout', methods=['POST'])
 def checkout():
-    """Process checkout and create an order"""
+    """Process checkout and create an order.
+    
+    Stock is decremented with conditional updates (stock_quantity >= qty)
+    taken in product id order, all in one transaction, so concurrent
+    checkouts can neither oversell nor deadlock each other. An optional
+    Idempotency-Key header makes client retries return the original order.
+    """
+    claimed_lines = None
     try:
         data = request.get_json()
         
@@ -31,37 +101,69 @@ def checkout():
             if not data.get(field):
                 return jsonify({'error': f'{field} is required'}), 400
         
-        session_id = get_session_id()
+        session_id = current_cart_id()
         if not session_id:
             return jsonify({'error': 'No cart session found'}), 400
         
-        # Get cart items
-        cart_items = CartItem.query.filter_by(session_id=session_id).all()
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            if len(idempotency_key) > 255:
+                return jsonify({'error': 'Idempotency-Key must be at most 255 characters'}), 400
+            replay = replay_idempotent_checkout(idempotency_key, session_id)
+            if replay is not None:
+                return replay
+        
+        store = get_cart_store()
+        lines = store.lines(session_id)
         
-        if not cart_items:
+        if not lines and idempotency_key:
+            # The original request may have committed since the check above
+            db.session.rollback()
+            replay = replay_idempotent_checkout(idempotency_key, session_id)
+            if replay is not None:
+                return replay
+        
+        if not lines:
             return jsonify({'error': 'Cart is empty'}), 400
         
+        # Load every product in the cart with one query
+        products = {
+            product.id: product
+            for product in Product.query.filter(
+                Product.id.in_([line['product_id'] for line in lines])
+            ).all()
+        }
+        
         # Calculate total and validate stock
         total_amount = 0
         order_items_data = []
         
-        for cart_item in cart_items:
-            product = cart_item.product
+        for line in sorted(lines, key=lambda line: line['product_id']):
+            product = products.get(line['product_id'])
             if not product or not product.is_active:
-                return jsonify({'error': f'Product {cart_item.product_id} is no longer available'}), 400
+                return jsonify({'error': f"Product {line['product_id']} is no longer available"}), 400
             
-            if product.stock_quantity < cart_item.quantity:
+            if product.stock_quantity < line['quantity']:
                 return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
             
-            item_total = product.price * cart_item.quantity
+            item_total = product.price * line['quantity']
             total_amount += item_total
             
             order_items_data.append({
                 'product_id': product.id,
-                'quantity': cart_item.quantity,
+                'product_name': product.name,
+                'quantity': line['quantity'],
                 'price': product.price
             })
         
+        # Claim the cart first so a concurrent checkout of the same cart fails
+        if not store.claim(session_id, lines):
+            if idempotency_key:
+                return idempotent_checkout_conflict(idempotency_key, session_id)
+            db.session.rollback()
+            return jsonify({'error': 'Cart changed during checkout, please try again'}), 409
+        claimed_lines = lines
+        
         # Create order
         order = Order(
             order_number=generate_order_number(),
@@ -75,56 +177,112 @@ def checkout():
         db.session.add(order)
         db.session.flush()  # Get the order ID
         
-        # Create order items and update stock
+        if idempotency_key:
+            db.session.add(OrderIdempotencyKey(
+                key=idempotency_key,
+                session_id=session_id,
+                order_id=order.id
+            ))
+            try:
+                db.session.flush()
+            except IntegrityError:
+                # A concurrent retry with the same key committed first
+                db.session.rollback()
+                store.restore(session_id, claimed_lines)
+                claimed_lines = None
+                return idempotent_checkout_conflict(idempotency_key, session_id)
+        
+        # Decrement stock in product id order; each update only succeeds if
+        # enough stock is left at the moment it runs
         for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item_data['product_id'],
-                quantity=item_data['quantity'],
-                price=item_data['price']
-            )
-            db.session.add(order_item)
-            
-            # Update product stock
-            product = Product.query.get(item_data['product_id'])
-            product.stock_quantity -= item_data['quantity']
+            updated = db.session.execute(
+                update(Product)
+                .where(
+                    Product.id == item_data['product_id'],
+                    Product.is_active == True,
+                    Product.stock_quantity >= item_data['quantity']
+                )
+                .values(stock_quantity=Product.stock_quantity - item_data['quantity'])
+                # Bumps the product and stock versions, not the catalog version
+                .execution_options(synchronize_session=False, stock_only=True)
+            ).rowcount
+            if updated != 1:
+                db.session.rollback()
+                store.restore(session_id, claimed_lines)
+                return jsonify({'error': f"Insufficient stock for {item_data['product_name']}"}), 400
         
-        # Clear cart
-        CartItem.query.filter_by(session_id=session_id).delete()
+        # Create order items in one bulk insert
+        db.session.execute(insert(OrderItem), [{
+            'order_id': order.id,
+            'product_id': item_data['product_id'],
+            'quantity': item_data['quantity'],
+            'price': item_data['price']
+        } for item_data in order_items_data])
         
         db.session.commit()
+        claimed_lines = None
         
-        return jsonify({
-            'message': 'Order placed successfully',
-            'order': order.to_dict()
-        }), 201
+        return order_created_response(order.id)
     
     except Exception as e:
         db.session.rollback()
+        if claimed_lines:
+            store.restore(session_id, claimed_lines)
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/orders/<order_number>', methods=['GET'])
+@read_replica
 def get_order(order_number):
     """Get order details by order number"""
     try:
-        order = Order.query.filter_by(order_number=order_number).first()
+        try:
+            fields, product_fields = request_order_fields(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        order = Order.query.options(*order_load_options(fields, product_fields)).filter_by(
+            order_number=order_number
+        ).first()
         
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
-        return jsonify(order.to_dict())
+        return jsonify(order.to_dict(fields, product_fields))
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/orders/email/<email>', methods=['GET'])
+@read_replica
 def get_orders_by_email(email):
     """Get all orders for a customer email"""
     try:
+        try:
+            fields, product_fields = request_order_fields(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
-        orders = Order.query.filter_by(customer_email=email).order_by(
+        if 'cursor' in request.args:
+            try:
+                result = keyset_paginate(
+                    Order.query.options(*order_load_options(fields, product_fields)).filter_by(customer_email=email),
+                    Order.created_at, True, per_page,
+                    cursor=request.args.get('cursor'),
+                    count=request.args.get('count', 'none')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'orders': [order.to_dict(fields, product_fields) for order in result.items],
+                'per_page': per_page,
+                **result.to_dict()
+            })
+        
+        orders = Order.query.options(*order_load_options(fields, product_fields)).filter_by(customer_email=email).order_by(
             Order.created_at.desc()
         ).paginate(
             page=page,
@@ -133,7 +291,7 @@ def get_orders_by_email(email):
         )
         
         return jsonify({
-            'orders': [order.to_dict() for order in orders.items],
+            'orders': [order.to_dict(fields, product_fields) for order in orders.items],
             'total': orders.total,
             'pages': orders.pages,
             'current_page': page,
@@ -148,14 +306,34 @@ def get_orders_by_email(email):
 def get_all_orders():
     """Get all orders (Admin only)"""
     try:
+        try:
+            fields, product_fields = request_order_fields(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        status = request.args.get('status')
         
-        query = Order.query
+        try:
+            query = apply_order_filters(Order.query.options(*order_load_options(fields, product_fields)), request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format, use YYYY-MM-DD'}), 400
         
-        if status:
-            query = query.filter_by(status=status)
+        if 'cursor' in request.args:
+            try:
+                result = keyset_paginate(
+                    query, Order.created_at, True, per_page,
+                    cursor=request.args.get('cursor'),
+                    count=request.args.get('count', 'none')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'orders': [order.to_dict(fields, product_fields) for order in result.items],
+                'per_page': per_page,
+                **result.to_dict()
+            })
         
         orders = query.order_by(Order.created_at.desc()).paginate(
             page=page,
@@ -164,7 +342,7 @@ def get_all_orders():
         )
         
         return jsonify({
-            'orders': [order.to_dict() for order in orders.items],
+            'orders': [order.to_dict(fields, product_fields) for order in orders.items],
             'total': orders.total,
             'pages': orders.pages,
             'current_page': page,
@@ -192,6 +370,9 @@ def update_order_status(order_id):
         
         db.session.commit()
         
+        # Reload with items so serialization doesn't lazy-load per item
+        order = Order.query.options(Order.eager_items()).filter_by(id=order_id).one()
+        
         return jsonify({
             'message': 'Order status updated successfully',
             'order': order.to_dict()
@@ -205,28 +386,7 @@ def update_order_status(order_id):
 def get_order_stats():
     """Get order statistics (Admin only)"""
     try:
-        total_orders = Order.query.count()
-        total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-        
-        # Orders by status
-        status_counts = db.session.query(
-            Order.status,
-            db.func.count(Order.id)
-        ).group_by(Order.status).all()
-        
-        status_stats = {status: count for status, count in status_counts}
-        
-        # Recent orders (last 30 days)
-        from datetime import datetime, timedelta
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_orders = Order.query.filter(Order.created_at >= thirty_days_ago).count()
-        
-        return jsonify({
-            'total_orders': total_orders,
-            'total_revenue': total_revenue,
-            'status_breakdown': status_stats,
-            'recent_orders_30_days': recent_orders
-        })
+        return jsonify(order_stats())
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
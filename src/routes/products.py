@@ -1,11 +1,20 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.product import Product
-from sqlalchemy import or_
+from src.search import apply_search
+from src.pagination import keyset_paginate
+from src.cache import catalog_cache, invalidate_catalog
+from src.fields import request_product_fields, product_columns
+from src.serialization import product_fragment
+from src.db_routing import read_replica
+from src.catalog_version import (
+    current_catalog_version, stock_window, is_not_modified, with_validators, not_modified_response
+)
 
 products_bp = Blueprint('products', __name__)
 
 @products_bp.route('/products', methods=['GET'])
+@read_replica
 def get_products():
     """Get all products with optional filtering and pagination"""
     try:
@@ -13,8 +22,30 @@ def get_products():
         per_page = request.args.get('per_page', 12, type=int)
         category = request.args.get('category')
         search = request.args.get('search')
-        sort_by = request.args.get('sort_by', 'created_at')
+        sort_by = request.args.get('sort_by', 'relevance' if search else 'created_at')
         sort_order = request.args.get('sort_order', 'desc')
+        try:
+            fields = request_product_fields(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        version, last_modified = current_catalog_version()
+        # Stock changed by checkout doesn't move the catalog version; listings pick it up per window
+        window, window_started = stock_window()
+        last_modified = max(last_modified, window_started) if last_modified else window_started
+        # Keyed on the shared version the ETag comes from: a write only clears the
+        # writing worker's cache, and a replica may lag the primary
+        cache_key = (
+            'products', page, per_page, category or None, (search or '').strip() or None,
+            sort_by, sort_order, request.args.get('cursor'), request.args.get('count'), fields, version, window
+        )
+        etag = f'catalog-{version}-{window}'
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            return with_validators(jsonify(cached), etag, last_modified)
         
         # Build query
         query = Product.query.filter_by(is_active=True)
@@ -23,30 +54,48 @@ def get_products():
         if category:
             query = query.filter(Product.category == category)
         
+        cursor_mode = 'cursor' in request.args
+        
         if search:
-            query = query.filter(
-                or_(
-                    Product.name.contains(search),
-                    Product.description.contains(search)
-                )
-            )
+            query = apply_search(query, search, order_by_rank=(sort_by == 'relevance' and not cursor_mode))
         
-        # Apply sorting
-        if sort_by == 'price':
-            if sort_order == 'asc':
-                query = query.order_by(Product.price.asc())
-            else:
-                query = query.order_by(Product.price.desc())
+        # Resolve sorting
+        if sort_by == 'relevance' and search:
+            sort_column = None  # Already ordered by search rank
+        elif sort_by == 'price':
+            sort_column = Product.price
         elif sort_by == 'name':
-            if sort_order == 'asc':
-                query = query.order_by(Product.name.asc())
-            else:
-                query = query.order_by(Product.name.desc())
+            sort_column = Product.name
         else:  # created_at
-            if sort_order == 'asc':
-                query = query.order_by(Product.created_at.asc())
-            else:
-                query = query.order_by(Product.created_at.desc())
+            sort_column = Product.created_at
+        descending = sort_order != 'asc'
+        
+        if fields is not None:
+            query = query.options(product_columns(fields, [sort_column.key] if sort_column is not None else []))
+        
+        if cursor_mode:
+            if sort_column is None:
+                return jsonify({'error': 'Cursor pagination requires sort_by of created_at, price or name'}), 400
+            try:
+                result = keyset_paginate(
+                    query, sort_column, descending, per_page,
+                    cursor=request.args.get('cursor'),
+                    count=request.args.get('count', 'none')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            payload = {
+                'products': [product_fragment(product, fields) for product in result.items],
+                'per_page': per_page,
+                **result.to_dict()
+            }
+            catalog_cache.set(cache_key, payload)
+            return with_validators(jsonify(payload), etag, last_modified)
+        
+        # Apply sorting
+        if sort_column is not None:
+            query = query.order_by(sort_column.desc() if descending else sort_column.asc())
         
         # Paginate
         products = query.paginate(
@@ -55,39 +104,80 @@ def get_products():
             error_out=False
         )
         
-        return jsonify({
-            'products': [product.to_dict() for product in products.items],
+        payload = {
+            'products': [product_fragment(product, fields) for product in products.items],
             'total': products.total,
             'pages': products.pages,
             'current_page': page,
             'per_page': per_page
-        })
+        }
+        catalog_cache.set(cache_key, payload)
+        return with_validators(jsonify(payload), etag, last_modified)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/products/<int:product_id>', methods=['GET'])
+@read_replica
 def get_product(product_id):
     """Get a single product by ID"""
     try:
-        product = Product.query.get_or_404(product_id)
-        if not product.is_active:
+        try:
+            fields = request_product_fields(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # The product's own version moves with every write to it, checkout's stock updates included
+        version = db.session.query(Product.version).filter(
+            Product.id == product_id, Product.is_active == True
+        ).scalar()
+        if version is None:
             return jsonify({'error': 'Product not found'}), 404
-        return jsonify(product.to_dict())
+        etag = f'product-{product_id}-{version}'
+        if is_not_modified(etag, None):
+            return not_modified_response(etag, None)
+        
+        cache_key = ('product', product_id, fields, version)
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            return with_validators(jsonify(cached), etag, None)
+        
+        query = Product.query
+        if fields is not None:
+            query = query.options(product_columns(fields, ['is_active']))
+        product = query.filter(Product.id == product_id).first()
+        if not product or not product.is_active:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        payload = product_fragment(product, fields)
+        catalog_cache.set(cache_key, payload)
+        return with_validators(jsonify(payload), etag, None)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/products/categories', methods=['GET'])
+@read_replica
 def get_categories():
     """Get all unique product categories"""
     try:
+        version, last_modified = current_catalog_version()
+        etag = f'categories-{version}'
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+        
+        cached = catalog_cache.get(('categories', version))
+        if cached is not None:
+            return with_validators(jsonify(cached), etag, last_modified)
+        
         categories = db.session.query(Product.category).filter(
             Product.is_active == True,
             Product.category.isnot(None)
         ).distinct().all()
         
         category_list = [cat[0] for cat in categories if cat[0]]
-        return jsonify({'categories': category_list})
+        payload = {'categories': category_list}
+        catalog_cache.set(('categories', version), payload)
+        return with_validators(jsonify(payload), etag, last_modified)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -113,6 +203,7 @@ def create_product():
         
         db.session.add(product)
         db.session.commit()
+        invalidate_catalog([product.id])
         
         return jsonify(product.to_dict()), 201
     
@@ -147,6 +238,7 @@ def update_product(product_id):
             product.is_active = bool(data['is_active'])
         
         db.session.commit()
+        invalidate_catalog([product_id])
         return jsonify(product.to_dict())
     
     except Exception as e:
@@ -160,6 +252,7 @@ def delete_product(product_id):
         product = Product.query.get_or_404(product_id)
         product.is_active = False  # Soft delete
         db.session.commit()
+        invalidate_catalog([product_id])
         return jsonify({'message': 'Product deleted successfully'})
     
     except Exception as e:
@@ -172,15 +265,39 @@ def get_all_products_admin():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        try:
+            fields = request_product_fields(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = Product.query
+        if fields is not None:
+            query = query.options(product_columns(fields))
         
-        products = Product.query.paginate(
+        if 'cursor' in request.args:
+            try:
+                result = keyset_paginate(
+                    query, Product.id, False, per_page,
+                    cursor=request.args.get('cursor'),
+                    count=request.args.get('count', 'none')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'products': [product_fragment(product, fields) for product in result.items],
+                'per_page': per_page,
+                **result.to_dict()
+            })
+        
+        products = query.paginate(
             page=page, 
             per_page=per_page, 
             error_out=False
         )
         
         return jsonify({
-            'products': [product.to_dict() for product in products.items],
+            'products': [product_fragment(product, fields) for product in products.items],
             'total': products.total,
             'pages': products.pages,
             'current_page': page,
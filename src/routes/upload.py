@@ -1,43 +1,89 @@
 import os
-import uuid
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+import hashlib
+import shutil
+import tempfile
+from flask import Blueprint, Request, request, jsonify, current_app, send_from_directory, send_file
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from PIL import Image
+from src.models.product import Product
 from src.routes.auth import admin_required
+from src.images import (
+    ALLOWED_EXTENSIONS, RENDITION_NAME, upload_folder, submit_image_job, image_job_status,
+    find_original, rendition_set_files, derivative_path, DERIVATIVE_WIDTHS, DERIVATIVE_FORMATS,
+    IMMUTABLE_MAX_AGE, UPLOAD_URL_PREFIX
+)
 
 upload_bp = Blueprint('upload', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+def immutable(response):
+    """Mark an image response as cacheable forever; its URL never changes content"""
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def resize_image(image_path, max_width=800, max_height=600):
-    """Resize image while maintaining aspect ratio"""
-    try:
-        with Image.open(image_path) as img:
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Calculate new dimensions
-            img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-            
-            # Save optimized image
-            img.save(image_path, 'JPEG', quality=85, optimize=True)
-            return True
-    except Exception as e:
-        print(f"Error resizing image: {e}")
-        return False
+class HashingFileStream:
+    """Upload spool file that hashes and bounds the body as it is written.
+
+    The temp file lives in the upload folder, so storing it is a hard link
+    on the same filesystem, and it is deleted when the request closes it.
+    """
+    
+    def __init__(self, folder, max_size):
+        self.file = tempfile.NamedTemporaryFile(dir=folder, prefix='.upload-', suffix='.tmp')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.max_size = max_size
+    
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        self.sha256.update(data)
+        return self.file.write(data)
+    
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+    
+    def store(self, path):
+        """Link the spooled upload to ``path``; returns False if ``path`` already exists"""
+        self.file.flush()
+        try:
+            os.link(self.file.name, path)
+        except FileExistsError:
+            return False
+        except OSError:
+            # Filesystems without hard links
+            if os.path.exists(path):
+                return False
+            shutil.copyfile(self.file.name, path)
+        return True
+
+class UploadRequest(Request):
+    """Spools product image uploads through ``HashingFileStream``"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint != 'upload.upload_product_image':
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        folder = upload_folder()
+        os.makedirs(folder, exist_ok=True)
+        return HashingFileStream(folder, current_app.config['MAX_UPLOAD_BYTES'])
+
+def image_reference_count(stem):
+    """Number of products, active or not, whose image is ``stem``'s rendition set"""
+    return Product.query.filter(Product.image_url.like(f'{UPLOAD_URL_PREFIX}{stem}%')).count()
 
 @upload_bp.route('/upload/product-image', methods=['POST'])
 @admin_required
 def upload_product_image():
-    """Upload and process product image"""
+    """Save a product image under its content hash and queue its renditions"""
     try:
+        # MAX_CONTENT_LENGTH bounds the body before it is read;
+        # HashingFileStream bounds the file itself as it is spooled
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
         
@@ -49,53 +95,95 @@ def upload_product_image():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Invalid file type. Allowed: PNG, JPG, JPEG, GIF, WEBP'}), 400
         
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
+        stream = file.stream
+        if not isinstance(stream, HashingFileStream):
+            return jsonify({'error': 'Upload was not streamed'}), 500
         
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({'error': 'File too large. Maximum size: 5MB'}), 400
-        
-        # Generate unique filename
+        # Identical bytes always map to the same stem and therefore the same files
         file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        
-        # Create upload path
-        upload_folder = os.path.join(current_app.static_folder, 'uploads', 'products')
-        os.makedirs(upload_folder, exist_ok=True)
-        
-        file_path = os.path.join(upload_folder, unique_filename)
-        
-        # Save file
-        file.save(file_path)
-        
-        # Resize and optimize image
-        if not resize_image(file_path):
-            # If resize fails, remove the file
-            os.remove(file_path)
+        stem = stream.sha256.hexdigest()
+        folder = upload_folder()
+        
+        existing = find_original(folder, stem)
+        source_path = os.path.join(folder, f"{stem}_original.{file_extension}")
+        deduplicated = existing is not None or not stream.store(source_path)
+        job_id = stem
+        if not deduplicated:
+            submit_image_job(source_path, stem)
+        elif existing is not None and image_job_status(stem)['status'] == 'failed':
+            # Retry: the earlier failure may have been the pool, not the image
+            os.remove(os.path.join(folder, f"{stem}.error"))
+            submit_image_job(os.path.join(folder, existing), stem)
+        
+        status = image_job_status(job_id)
+        if status['status'] == 'failed':
+            for name in rendition_set_files(folder, stem):
+                os.remove(os.path.join(folder, name))
             return jsonify({'error': 'Failed to process image'}), 500
         
-        # Return the URL path for the image
-        image_url = f"/api/uploads/products/{unique_filename}"
-        
         return jsonify({
             'message': 'Image uploaded successfully',
-            'image_url': image_url,
-            'filename': unique_filename
-        }), 201
-        
+            'image_url': status['image_url'],
+            'filename': os.path.basename(status['image_url']),
+            'job_id': job_id,
+            'status': status['status'],
+            'status_url': f"/api/upload/jobs/{job_id}",
+            'deduplicated': deduplicated,
+            'size': stream.size
+        }), 201 if status['status'] == 'done' else 202
+        
+    except RequestEntityTooLarge:
+        max_mb = current_app.config['MAX_UPLOAD_BYTES'] // (1024 * 1024)
+        return jsonify({'error': f'File too large. Maximum size: {max_mb}MB'}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@upload_bp.route('/upload/jobs/<job_id>', methods=['GET'])
+@admin_required
+def get_image_job(job_id):
+    """Get the processing status of an uploaded image"""
+    try:
+        status = image_job_status(job_id)
+        if status is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(status)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @upload_bp.route('/uploads/products/<filename>')
 def serve_product_image(filename):
-    """Serve uploaded product images"""
+    """Serve uploaded product images, optionally resized with ?w= and ?format="""
     try:
-        upload_folder = os.path.join(current_app.static_folder, 'uploads', 'products')
-        return send_from_directory(upload_folder, filename)
-    except Exception as e:
+        folder = upload_folder()
+        filename = secure_filename(filename)
+        width = request.args.get('w', type=int)
+        fmt = request.args.get('format')
+        
+        if width is not None or fmt is not None:
+            fmt = fmt or filename.rsplit('.', 1)[-1].lower()
+            fmt = 'jpg' if fmt == 'jpeg' else fmt
+            width = width or max(DERIVATIVE_WIDTHS)
+            if width not in DERIVATIVE_WIDTHS:
+                return jsonify({'error': f'Unsupported width. Allowed: {", ".join(map(str, DERIVATIVE_WIDTHS))}'}), 400
+            if fmt not in DERIVATIVE_FORMATS:
+                return jsonify({'error': f'Unsupported format. Allowed: {", ".join(DERIVATIVE_FORMATS)}'}), 400
+            
+            path = derivative_path(folder, filename, width, fmt)
+            if path is None:
+                return jsonify({'error': 'Image not found'}), 404
+            return immutable(send_file(path, max_age=IMMUTABLE_MAX_AGE))
+        
+        if not os.path.exists(os.path.join(folder, filename)):
+            # Until its job finishes, a rendition is stood in for by the original
+            match = RENDITION_NAME.match(filename)
+            original = match and find_original(folder, match.group('stem'))
+            if original:
+                return send_from_directory(folder, original, max_age=0)
+        return immutable(send_from_directory(folder, filename, max_age=IMMUTABLE_MAX_AGE))
+    except NotFound:
         return jsonify({'error': 'Image not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @upload_bp.route('/upload/delete-image', methods=['DELETE'])
 @admin_required
@@ -111,10 +199,23 @@ def delete_product_image():
         # Security check - ensure filename is safe
         filename = secure_filename(filename)
         
-        file_path = os.path.join(current_app.static_folder, 'uploads', 'products', filename)
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        folder = upload_folder()
+        match = RENDITION_NAME.match(filename)
+        if match:
+            # Uploads are shared between products with identical images
+            references = image_reference_count(match.group('stem'))
+            if references:
+                return jsonify({
+                    'error': 'Image is still used by other products',
+                    'references': references
+                }), 409
+        files = rendition_set_files(folder, match.group('stem')) if match else []
+        if not files and os.path.exists(os.path.join(folder, filename)):
+            files = [filename]
+        
+        if files:
+            for name in files:
+                os.remove(os.path.join(folder, name))
             return jsonify({'message': 'Image deleted successfully'})
         else:
             return jsonify({'error': 'Image not found'}), 404
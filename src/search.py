@@ -0,0 +1,155 @@
+"""
+Full-text product search.
+
+SQLite uses an external-content FTS5 table kept current by triggers on
+``product``; PostgreSQL uses a stored, generated ``tsvector`` column with a
+GIN index. Both are maintained by the database itself, so every write path
+(ORM, bulk updates, soft deletes) keeps the index in sync. Backends without
+either feature fall back to the original ``LIKE`` scan.
+
+``ensure_search_index`` creates the index (``python src/manage.py init``);
+each worker detects which one exists on its first search.
+"""
+import re
+from flask import current_app
+from sqlalchemy import text, func, or_, false, table, column, literal_column
+from src.models.user import db
+from src.models.product import Product
+
+FTS_TABLE = 'product_search'
+TSVECTOR_COLUMN = 'search_vector'
+
+_product_search = table(FTS_TABLE, column('rowid'), column('rank'))
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description, category,
+        content='product', content_rowid='id',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF name, description, category ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END""",
+]
+
+_POSTGRES_DDL = [
+    f"""ALTER TABLE product ADD COLUMN IF NOT EXISTS {TSVECTOR_COLUMN} tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED""",
+    f"CREATE INDEX IF NOT EXISTS ix_product_{TSVECTOR_COLUMN} ON product USING GIN ({TSVECTOR_COLUMN})",
+]
+
+def ensure_search_index():
+    """Create the search index for the bound database and record the backend.
+
+    Safe to call on every start: all DDL is idempotent, and the SQLite index
+    is only rebuilt from existing rows when it is first created.
+    """
+    backend = 'like'
+    dialect = db.engine.dialect.name
+
+    try:
+        if dialect == 'sqlite':
+            with db.engine.begin() as conn:
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': FTS_TABLE}
+                ).first()
+                for statement in _SQLITE_DDL:
+                    conn.execute(text(statement))
+                if not exists:
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            backend = 'fts5'
+        elif dialect == 'postgresql':
+            with db.engine.begin() as conn:
+                for statement in _POSTGRES_DDL:
+                    conn.execute(text(statement))
+            backend = 'tsvector'
+    except Exception as e:
+        print(f"Full-text search unavailable, falling back to LIKE: {e}")
+
+    current_app.extensions['product_search'] = backend
+    return backend
+
+def detect_search_backend():
+    """Return the backend whose index already exists in the bound database"""
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.connect() as conn:
+            if dialect == 'sqlite' and conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first():
+                return 'fts5'
+            if dialect == 'postgresql' and conn.execute(
+                text("SELECT 1 FROM information_schema.columns "
+                     "WHERE table_name = 'product' AND column_name = :name"),
+                {'name': TSVECTOR_COLUMN}
+            ).first():
+                return 'tsvector'
+    except Exception as e:
+        print(f"Could not detect the search index, falling back to LIKE: {e}")
+    return 'like'
+
+def search_backend():
+    """Return the search backend for the current app, detected on first use"""
+    backend = current_app.extensions.get('product_search')
+    if backend is None:
+        backend = current_app.extensions['product_search'] = detect_search_backend()
+    return backend
+
+def _terms(search):
+    return re.findall(r'\w+', search.lower())
+
+def apply_search(query, search, order_by_rank=True):
+    """Restrict a Product query to rows matching ``search``.
+
+    Every word must match, as a prefix, in the name, category or
+    description. With ``order_by_rank`` the best matches come first and ties
+    are broken by id so pages are stable.
+    """
+    backend = search_backend()
+
+    if backend == 'like':
+        return query.filter(
+            or_(
+                Product.name.contains(search),
+                Product.description.contains(search)
+            )
+        )
+
+    terms = _terms(search)
+    if not terms:
+        return query.filter(false())
+
+    if backend == 'fts5':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        query = query.join(_product_search, _product_search.c.rowid == Product.id).filter(
+            text(f"{FTS_TABLE} MATCH :search_match").bindparams(search_match=match)
+        )
+        if order_by_rank:
+            query = query.order_by(_product_search.c.rank, Product.id)
+        return query
+
+    # tsvector
+    vector = literal_column(f'product.{TSVECTOR_COLUMN}')
+    tsquery = func.to_tsquery('english', ' & '.join(f'{term}:*' for term in terms))
+    query = query.filter(vector.op('@@')(tsquery))
+    if order_by_rank:
+        query = query.order_by(func.ts_rank(vector, tsquery).desc(), Product.id)
+    return query
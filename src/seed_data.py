@@ -112,6 +112,8 @@ def seed_database():
 
 if __name__ == '__main__':
     from src.main import app
+    from src.manage import init_database
+    init_database(app, seed=False)
     with app.app_context():
         seed_database()
 
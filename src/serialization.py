@@ -0,0 +1,108 @@
+"""
+Fast JSON encoding and cached product fragments.
+
+``FastJSONProvider`` encodes responses with orjson when it is installed
+(``pip install orjson``) and with the stdlib encoder otherwise. Both produce
+the same JSON values, including Flask's HTTP-date format for datetimes;
+orjson writes non-ASCII text as UTF-8 rather than escaping it.
+
+``product_fragment`` returns a product's serialized dict from a cache keyed
+on product id, ``Product.version`` and the requested fields. Every write to
+a product bumps its version (see ``src/catalog_version.py``), so an entry is
+never read once its product has changed; it just ages out. With orjson each
+fragment also carries its encoded bytes, and the provider splices those into
+list and order responses instead of encoding the product again. Fragments
+are shared between requests and must not be mutated.
+"""
+import json
+import re
+import secrets
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import inspect
+from src.cache import fragment_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class ProductFragment(dict):
+    """A product's ``to_dict`` output plus, with orjson, its encoded bytes"""
+    __slots__ = ('json',)
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.json = orjson.dumps(data, option=orjson.OPT_SORT_KEYS) if orjson is not None else None
+
+def product_fragment(product, fields=None):
+    """Serialized ``product`` restricted to ``fields``, from the fragment cache when possible"""
+    state = inspect(product)
+    # Unflushed changes or an unloaded version mean the cache key can't be trusted
+    if state.pending or state.modified or 'version' in state.unloaded or product.version is None:
+        return product.to_dict(fields)
+
+    key = (product.id, product.version, fields)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = ProductFragment(product.to_dict(fields))
+        fragment_cache.set(key, fragment)
+    return fragment
+
+# Stands in for a fragment during encoding; random so no real string can match it
+_MARKER = f'__fragment_{secrets.token_hex(8)}_'
+_MARKER_PATTERN = re.compile(rb'"' + _MARKER.encode() + rb'(\d+)"')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """``DefaultJSONProvider`` that uses orjson when available"""
+
+    def _options(self, indent):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        else:
+            # Fragments are compact, so only splice them into compact output
+            options |= orjson.OPT_PASSTHROUGH_SUBCLASS
+        return options
+
+    def _encode(self, obj, indent=False):
+        fragments = []
+
+        def default(o):
+            if isinstance(o, ProductFragment) and o.json is not None:
+                fragments.append(o.json)
+                return f'{_MARKER}{len(fragments) - 1}'
+            # Passed through as subclasses; encode them as their base type
+            for base in (dict, list, tuple, str, int, float):
+                if isinstance(o, base):
+                    return base(o)
+            return self.default(o)
+
+        try:
+            body = orjson.dumps(obj, default=default, option=self._options(indent))
+        except orjson.JSONEncodeError:
+            # Integers past 64 bits and the like; the stdlib handles them
+            return self._stdlib_encode(obj, indent)
+        if fragments:
+            body = _MARKER_PATTERN.sub(lambda match: fragments[int(match.group(1))], body)
+        return body
+
+    def _stdlib_encode(self, obj, indent):
+        return json.dumps(
+            obj, default=self.default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+            indent=2 if indent else None, separators=None if indent else (',', ':')
+        ).encode()
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = self._encode(obj, indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Serving of the built frontend from ``src/static``.
+
+``init_static_files`` walks the static folder once at startup and keeps a
+manifest of every asset: its size, ETag, whether its name carries a Vite
+content hash, and which precompressed ``.br``/``.gz`` siblings exist.
+Requests are answered from the manifest without touching the filesystem:
+hashed assets are cached for a year as immutable, everything else must
+revalidate, and ``index.html`` (the SPA fallback for unknown paths) is
+held in memory together with its compressed variants.
+
+``SENDFILE_MODE`` hands file bodies to a front proxy instead of streaming
+them through the worker; it applies to uploads and resized images too:
+
+- ``x-sendfile``: Apache/lighttpd ``X-Sendfile`` with the absolute path.
+- ``x-accel-redirect``: nginx ``X-Accel-Redirect`` to
+  ``SENDFILE_ACCEL_PREFIX`` + the absolute path, for a location such as
+  ``location /_files/ { internal; alias /; }``. Precompressed variants
+  are then left to nginx's ``gzip_static``/``brotli_static``.
+
+Precompress a build after copying it into place (brotli needs
+``pip install brotli``; gzip is always written):
+
+Usage:
+    python src/static_files.py compress
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+from flask import Response, current_app, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Vite emits names like index-Ds8MEQYm.js
+HASHED_NAME = re.compile(r'-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'image/x-icon', 'application/manifest+json')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+EXCLUDED_DIRS = {'uploads'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+class StaticAsset:
+    """One servable file and its precompressed variants"""
+
+    def __init__(self, path, relative_path):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.hashed = bool(HASHED_NAME.search(relative_path))
+        self.etag = f'{stat.st_size:x}-{int(stat.st_mtime):x}'
+        self.variants = {
+            encoding: path + suffix for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)
+        }
+
+def _compressible(mimetype):
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+def build_manifest(root):
+    """Map each asset's URL path (relative to ``root``) to a ``StaticAsset``"""
+    manifest = {}
+    for directory, subdirs, files in os.walk(root):
+        if directory == root:
+            subdirs[:] = [name for name in subdirs if name not in EXCLUDED_DIRS]
+        for name in files:
+            if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                continue
+            path = os.path.join(directory, name)
+            relative_path = os.path.relpath(path, root).replace(os.sep, '/')
+            manifest[relative_path] = StaticAsset(path, relative_path)
+    return manifest
+
+class IndexPage:
+    """``index.html`` and its compressed variants held in memory"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:16]
+        self.variants = {'gzip': gzip.compress(self.body, 9)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(self.body)
+
+def init_static_files(app):
+    """Build the static manifest and install the sendfile mode"""
+    root = app.static_folder
+    manifest = build_manifest(root) if root and os.path.isdir(root) else {}
+    index_path = os.path.join(root, 'index.html') if root else None
+    index = IndexPage(index_path) if index_path and os.path.exists(index_path) else None
+    app.extensions['static_files'] = {'manifest': manifest, 'index': index}
+
+    mode = app.config.get('SENDFILE_MODE')
+    if mode not in (None, '', 'x-sendfile', 'x-accel-redirect'):
+        raise ValueError(f'Unknown SENDFILE_MODE: {mode}')
+    if mode:
+        # send_file then emits X-Sendfile with an empty body everywhere
+        app.config['USE_X_SENDFILE'] = True
+    if mode == 'x-accel-redirect':
+        prefix = app.config.get('SENDFILE_ACCEL_PREFIX', '/_files').rstrip('/')
+
+        @app.after_request
+        def _to_accel_redirect(response):
+            path = response.headers.pop('X-Sendfile', None)
+            if path is not None:
+                response.headers['X-Accel-Redirect'] = prefix + path
+            return response
+
+def _negotiate(variants):
+    """Pick the best encoding the client accepts among ``variants``"""
+    for encoding, _ in ENCODINGS:
+        if encoding in variants and request.accept_encodings[encoding]:
+            return encoding
+    return None
+
+def _cache(response, immutable):
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def _serve_asset(asset):
+    # nginx drops Content-Encoding on X-Accel-Redirect; it should use gzip_static instead
+    accel = current_app.config.get('SENDFILE_MODE') == 'x-accel-redirect'
+    encoding = None if accel else _negotiate(asset.variants)
+    etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return _cache(response, asset.hashed)
+
+    response = send_file(
+        asset.variants[encoding] if encoding else asset.path,
+        mimetype=asset.mimetype, etag=etag, conditional=True, max_age=None
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return _cache(response, asset.hashed)
+
+def _serve_index(index):
+    encoding = _negotiate(index.variants)
+    etag = f'{index.etag}-{encoding}' if encoding else index.etag
+    response = Response(index.variants[encoding] if encoding else index.body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return _cache(response.make_conditional(request), False)
+
+def serve_static(path):
+    """Serve ``path`` from the manifest, falling back to ``index.html``"""
+    state = current_app.extensions['static_files']
+    asset = state['manifest'].get(path)
+    if asset is not None and path != 'index.html':
+        return _serve_asset(asset)
+    if state['index'] is None:
+        return "index.html not found", 404
+    return _serve_index(state['index'])
+
+def compress_static(root):
+    """Write .gz (and .br, when brotli is installed) next to each compressible asset"""
+    written = 0
+    for path in (asset.path for asset in build_manifest(root).values() if _compressible(asset.mimetype)):
+        with open(path, 'rb') as f:
+            body = f.read()
+        variants = [('.gz', lambda: gzip.compress(body, 9))]
+        if brotli is not None:
+            variants.append(('.br', lambda: brotli.compress(body, quality=11)))
+        for suffix, compress in variants:
+            compressed = compress()
+            # Not worth a variant unless it actually saves bytes
+            if len(compressed) < len(body):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                written += 1
+    return written
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ['compress']:
+        print(__doc__)
+        return 1
+    root = argv[1] if len(argv) > 1 else os.path.join(os.path.dirname(__file__), 'static')
+    written = compress_static(root)
+    print(f"Wrote {written} precompressed files{'' if brotli else ' (gzip only; pip install brotli for .br)'}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
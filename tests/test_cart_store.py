@@ -0,0 +1,113 @@
+"""RedisCartStore against fakeredis, a local stand-in for a Redis server."""
+import fakeredis
+import pytest
+
+from src.cart_store import RedisCartStore
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+@pytest.fixture
+def store(server):
+    return RedisCartStore(client=fakeredis.FakeRedis(server=server), ttl=60)
+
+def test_add_merges_lines_and_keeps_totals(store):
+    store.add('cart', 1, 2, 10.0)
+    store.add('cart', 2, 1, 5.5)
+    store.add('cart', 1, 1, 10.0)
+
+    assert [(line['product_id'], line['quantity']) for line in store.lines('cart')] == [(1, 3), (2, 1)]
+    assert store.summary('cart') == {'count': 2, 'quantity': 4, 'total': 35.5}
+    assert 0 < store.client.ttl(store._key('cart')) <= 60
+
+def test_set_quantity_and_remove(store):
+    store.add('cart', 1, 2, 10.0)
+    store.add('cart', 2, 1, 5.0)
+
+    assert store.set_quantity('cart', 1, 5, 10.0)
+    assert store.remove('cart', 2)
+    assert not store.remove('cart', 2)
+    assert not store.set_quantity('cart', 3, 1, 1.0)
+    assert store.summary('cart') == {'count': 1, 'quantity': 5, 'total': 50.0}
+
+def test_summary_prices_lines_when_written(store):
+    # Documented drift: the running total keeps the price a line was written at
+    store.add('cart', 1, 2, 10.0)
+    assert store.summary('cart')['total'] == 20.0
+    store.set_quantity('cart', 1, 2, 12.0)
+    assert store.summary('cart')['total'] == 24.0
+
+def test_claim_takes_the_cart_only_if_unchanged(store):
+    store.add('cart', 1, 2, 10.0)
+    store.add('cart', 2, 1, 5.0)
+    lines = store.lines('cart')
+
+    store.add('cart', 2, 1, 5.0)
+    assert not store.claim('cart', lines)
+    assert store.summary('cart')['quantity'] == 4
+
+    lines = store.lines('cart')
+    assert store.claim('cart', lines)
+    assert store.lines('cart') == []
+    assert store.summary('cart') == {'count': 0, 'quantity': 0, 'total': 0.0}
+    assert not store.claim('cart', lines)
+
+def test_restore_puts_claimed_lines_back(store):
+    store.add('cart', 1, 2, 10.0)
+    store.add('cart', 2, 1, 5.0)
+    lines = store.lines('cart')
+    assert store.claim('cart', lines)
+
+    # Added while the failed checkout was running; restore merges with it
+    store.add('cart', 2, 3, 5.0)
+    store.restore('cart', lines)
+
+    restored = {line['product_id']: line for line in store.lines('cart')}
+    assert {product_id: line['quantity'] for product_id, line in restored.items()} == {1: 2, 2: 4}
+    assert restored[1]['created_at'].replace(microsecond=0) == lines[0]['created_at'].replace(microsecond=0)
+    assert store.summary('cart') == {'count': 2, 'quantity': 6, 'total': 40.0}
+
+def test_write_retries_after_a_concurrent_change(server, store):
+    other = RedisCartStore(client=fakeredis.FakeRedis(server=server), ttl=60)
+    store.add('cart', 1, 1, 10.0)
+
+    decode = RedisCartStore._decode
+    calls = []
+
+    def racing_decode(raw):
+        # Another worker writes the cart between WATCH and EXEC, once
+        calls.append(1)
+        if len(calls) == 1:
+            other.add('cart', 2, 1, 5.0)
+        return decode(raw)
+
+    store._decode = racing_decode
+    store.add('cart', 1, 2, 10.0)
+
+    assert len(calls) == 2
+    assert store.summary('cart') == {'count': 2, 'quantity': 4, 'total': 35.0}
+
+def test_claim_fails_on_a_concurrent_change(server, store):
+    other = RedisCartStore(client=fakeredis.FakeRedis(server=server), ttl=60)
+    store.add('cart', 1, 1, 10.0)
+    lines = store.lines('cart')
+
+    decode = RedisCartStore._decode
+
+    def racing_decode(raw):
+        other.add('cart', 1, 1, 10.0)
+        return decode(raw)
+
+    store._decode = racing_decode
+    assert not store.claim('cart', lines)
+    assert other.summary('cart')['quantity'] == 2
+
+def test_touch_and_clear(store):
+    store.add('cart', 1, 1, 10.0)
+    store.client.expire(store._key('cart'), 5)
+    store.touch('cart')
+    assert store.client.ttl(store._key('cart')) > 5
+
+    store.clear('cart')
+    assert store.lines('cart') == []